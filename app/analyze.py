@@ -1,94 +1,349 @@
-import base64
+import io
+import json
 import os
-import cv2
-import tempfile
-from openai import AzureOpenAI
+import re
+import numpy as np
+from PIL import Image
+import threading
 import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from app.utils.product_extractor import extract_product_name
 from dotenv import load_dotenv
 load_dotenv()
 
+try:
+    # Optional: SIMD base64 encoder with the same API as the stdlib module
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+try:
+    # Optional: faster hashing for response cache keys
+    from blake3 import blake3 as _cache_hasher
+except ImportError:
+    from hashlib import blake2b as _cache_hasher
+
+try:
+    # Optional: keyframe-indexed seeking makes interval sampling much cheaper
+    from decord import VideoReader, cpu
+except ImportError:
+    VideoReader = None
+
+try:
+    # Optional: upload frames to Blob Storage and send SAS URLs instead of base64
+    from azure.storage.blob import BlobServiceClient, BlobSasPermissions, ContentSettings, generate_blob_sas
+except ImportError:
+    BlobServiceClient = None
+
 # Azure OpenAI configuration
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
 AZURE_OPENAI_DEPLOYMENT_NAME = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME")
 AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION")
 AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
 
-# Initialize client
-client = AzureOpenAI(
-    api_version=AZURE_OPENAI_API_VERSION,
-    azure_endpoint=AZURE_OPENAI_ENDPOINT,
-    api_key=AZURE_OPENAI_API_KEY,
-)
-
-def encode_image(image_path):
-    with open(image_path, "rb") as img_file:
-        return base64.b64encode(img_file.read()).decode('utf-8')
-
-def extract_products_from_image(image_path, user_question, frame_number=None, fps=None):
+# Maximum number of frame requests in flight at once (keep under the TPM limit)
+MAX_CONCURRENT_REQUESTS = int(os.getenv("AZURE_OPENAI_MAX_CONCURRENCY", "8"))
+
+# Inputs with these extensions are analyzed as a single still image
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+# Frames are downscaled to this longest edge and JPEG quality before upload
+FRAME_MAX_EDGE = 768
+FRAME_JPEG_QUALITY = 75
+
+# Sampled frames whose dHash is within this Hamming distance of a recent
+# frame reuse that frame's response instead of issuing a new request
+DHASH_MAX_DISTANCE = 5
+DHASH_CACHE_SIZE = 32
+
+# Offline mode: submit all frame prompts as one Batch API job instead of
+# concurrent chat completions (requires a batch-enabled deployment)
+USE_BATCH_API = os.getenv("AZURE_OPENAI_USE_BATCH", "").lower() in ("1", "true", "yes")
+BATCH_MAX_POLL_SECONDS = 60
+BATCH_COMPLETION_WINDOW = "24h"
+# Batch requests may only run near the end of the completion window, so their
+# frame SAS URLs must outlive it
+BATCH_FRAME_SAS_TTL = timedelta(hours=25)
+
+# Number of frames fetched per decord get_batch() call
+DECORD_BATCH_SIZE = 16
+
+# Optional sampling rate in frames per second; when set, the sampling stride is derived
+# from each video's own fps instead of the fixed frame_interval
+SAMPLE_TARGET_FPS = float(os.getenv("ANALYSIS_SAMPLE_FPS") or 0)
+
+# Frames are uploaded here when a storage connection string is configured
+AZURE_STORAGE_CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+AZURE_STORAGE_FRAME_CONTAINER = os.getenv("AZURE_STORAGE_FRAME_CONTAINER", "frames")
+FRAME_SAS_TTL_MINUTES = 10
+_blob_service_client = None
+
+# Opt-in on-disk cache of completions, keyed by prompt + image bytes; useful
+# when re-running the same video during development
+RESPONSE_CACHE_DIR = os.getenv("AZURE_OPENAI_RESPONSE_CACHE_DIR")
+
+# Runs work that must not delay the analysis result (summary evaluation)
+_background_executor = ThreadPoolExecutor(max_workers=2)
+
+# Heuristics for deciding whether a frame response is a confident detection
+POSITIVE_PHRASES_RE = re.compile(r"located|visible|is on|can be seen|placed|sitting|present|seen", re.IGNORECASE)
+UNCERTAIN_PHRASES_RE = re.compile(r"not visible|not found|unclear|could be|might be|probably", re.IGNORECASE)
+END_PHRASE_RE = re.compile(r"end", re.IGNORECASE)
+
+# Outermost JSON object in a multi-frame response (tolerates code fences)
+JSON_OBJECT_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+# Static per-frame instructions live in the system message so they form an
+# identical prefix on every call (eligible for service-side prompt caching)
+FRAME_SYSTEM_PROMPT = """You are an expert retail shelf analyst. You are given retail shelf frames taken from a store video and a user question about products on the shelf. Answer factually for each frame using only that single image.
+- Do not assume what is outside the image or in other frames.
+- Be concise, courteous and specific to the query.
+- If the requested product or detail is not visible, state that clearly.
+- If the query refers to a specific product, end with a new line in exactly this format:
+product_name = <Product Name>
+- If no product is mentioned, skip that line.
+Return ONLY the answer and the product name line if applicable."""
+
+# Frames packed into one multi-image completion; 1 sends one request per frame
+FRAMES_PER_REQUEST = max(1, int(os.getenv("AZURE_OPENAI_FRAMES_PER_REQUEST", "6")))
+
+# Grouped requests answer in JSON, so they get their own system prompt instead
+# of FRAME_SYSTEM_PROMPT's plain-text output rule
+FRAME_GROUP_SYSTEM_PROMPT = """You are an expert retail shelf analyst. You are given several labeled retail shelf frames taken from a store video and a user question about products on the shelf. Answer factually for each frame using only that single image.
+- Do not assume what is outside the image or in other frames.
+- Be concise, courteous and specific to the query.
+- If the requested product or detail is not visible in a frame, state that clearly in that frame's answer.
+- If the query refers to a specific product, end each answer with a new line in exactly this format:
+product_name = <Product Name>
+Return ONLY the JSON object described in the user message, with no text before or after it."""
+
+FRAME_GROUP_INSTRUCTIONS = """Each frame below is labeled with its frame number. Answer the query separately for every frame, as if each were its own request.
+Return only a JSON object of the form {"frames": [{"frame": <frame number>, "answer": "<answer for that frame>"}]}."""
+
+_client = None
+_client_lock = threading.Lock()
+
+def _build_http_client():
+    """
+    Shared connection pool for all Azure OpenAI calls, so concurrent frame
+    requests reuse TLS connections. HTTP/2 is used when the h2 package is installed.
+    """
+    import httpx
+
+    limits = httpx.Limits(max_connections=64, max_keepalive_connections=32)
     try:
-        base64_image = encode_image(image_path)
-
-        timestamp_ms = None
-        if frame_number is not None and fps:
-            timestamp_ms = int((frame_number / fps) * 1000)
-            location_context = f"\n🖼 Frame Number: {frame_number}\n⏱ Timestamp (ms): {timestamp_ms}"
-        else:
-            location_context = ""
-            
-        # Check if API credentials are properly loaded
-        if not all([AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_DEPLOYMENT_NAME, 
-                   AZURE_OPENAI_API_VERSION, AZURE_OPENAI_API_KEY]):
-            return "Error: Azure OpenAI API credentials are missing. Please check your .env file."
-
-        prompt_text = f"""
-You are a helpful assistant that analyzes retail shelf images taken from video frames. Each image is from a different time and angle in the store video. The user will ask a question about products on the shelf. Your job is to analyze **only this single image/frame**, and return a clear and factual answer.
+        return httpx.Client(http2=True, limits=limits, timeout=30)
+    except ImportError:
+        return httpx.Client(limits=limits, timeout=30)
 
-🧠 General Instructions:
-- Use only the visible contents of this frame to answer the user's question.
-- Frame context: {location_context}
-- Do not assume what's outside the frame or in other frames.
-- Be concise, courteous, and specific to the query.
-- If the requested product or detail is **not visible**, state that clearly.
+# Summary prompt around the user query and the joined frame responses
+SUMMARY_PROMPT_HEADER = """
+You are a summarization assistant. Based on the following frame-wise analysis of a shelf video, write a summary of where the requested product(s) appear.
 - If the query refers to a **specific product**, then at the end of the summary add a new line in this format exactly:
   `product_name = <Product Name>`
 - If no product is mentioned, skip this line.
 
 Return ONLY the summary and the product name line if applicable.
 
-User Query: {user_question}
 """
+SUMMARY_PROMPT_FOOTER = """
 
-        response = client.chat.completions.create(
-            messages=[
+✏️ Return a helpful, natural language summary for the user. Do not include any extra information (about frames and frame numbers) other than the answer to the asked query.
+"""
+SUMMARY_FRAME_RESPONSE_CHARS = 400
+
+# Returned without a summary call when no frame had a confident detection
+NOT_FOUND_SUMMARY = "The requested product was not visible in this video."
+
+# Summary evaluation is a debugging signal; it costs an extra call per analysis
+EVAL_ENABLED = os.getenv("EVAL_ENABLED", "").lower() in ("1", "true", "yes")
+
+# openai and cv2 are imported on first use so that importing this module
+# (e.g. from UI-only scripts) does not pay for them up front
+def get_client():
+    global _client
+    # Frame workers call this concurrently; build the shared client only once
+    with _client_lock:
+        if _client is None:
+            from openai import AzureOpenAI
+
+            _client = AzureOpenAI(
+                api_version=AZURE_OPENAI_API_VERSION,
+                azure_endpoint=AZURE_OPENAI_ENDPOINT,
+                api_key=AZURE_OPENAI_API_KEY,
+                http_client=_build_http_client(),
+            )
+        return _client
+
+@lru_cache(maxsize=None)
+def _import_cv2():
+    import cv2
+
+    # Frame requests run in a thread pool; keep OpenCV from spawning its own
+    # worker threads on top of it
+    cv2.setNumThreads(1)
+    return cv2
+
+def encode_frame(frame):
+    """Downscale and JPEG-encode a decoded BGR frame in memory, returned as JPEG bytes."""
+    cv2 = _import_cv2()
+    # Resize and encode through PIL so a Pillow-SIMD install is picked up automatically
+    image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    image.thumbnail((FRAME_MAX_EDGE, FRAME_MAX_EDGE), Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=FRAME_JPEG_QUALITY, optimize=False)
+    return buffer.getvalue()
+
+def _get_blob_service_client():
+    global _blob_service_client
+    if _blob_service_client is None:
+        _blob_service_client = BlobServiceClient.from_connection_string(AZURE_STORAGE_CONNECTION_STRING)
+    return _blob_service_client
+
+def upload_frame_to_blob(jpeg_bytes, sas_ttl=None):
+    """
+    Upload a JPEG frame to Azure Blob Storage and return (read-only SAS URL, blob name).
+    The SAS lasts FRAME_SAS_TTL_MINUTES unless sas_ttl (a timedelta) says otherwise.
+    """
+    _get_blob_service_client()
+    blob_name = f"{uuid.uuid4().hex}.jpg"
+    blob_client = _blob_service_client.get_blob_client(container=AZURE_STORAGE_FRAME_CONTAINER, blob=blob_name)
+    blob_client.upload_blob(jpeg_bytes, content_settings=ContentSettings(content_type="image/jpeg"))
+
+    sas_token = generate_blob_sas(
+        account_name=_blob_service_client.account_name,
+        container_name=AZURE_STORAGE_FRAME_CONTAINER,
+        blob_name=blob_name,
+        account_key=_blob_service_client.credential.account_key,
+        permission=BlobSasPermissions(read=True),
+        expiry=datetime.now(timezone.utc) + (sas_ttl or timedelta(minutes=FRAME_SAS_TTL_MINUTES))
+    )
+    return f"{blob_client.url}?{sas_token}", blob_name
+
+def delete_frame_blobs(blob_names):
+    """
+    Delete uploaded frame blobs once the requests that read them have finished.
+    Best effort: blobs left behind by a failed delete or a crashed process are
+    removed by the container's lifecycle policy (see SETUP.md).
+    """
+    if not blob_names:
+        return
+    container = _get_blob_service_client().get_container_client(AZURE_STORAGE_FRAME_CONTAINER)
+    for blob_name in blob_names:
+        try:
+            container.delete_blob(blob_name)
+        except Exception as e:
+            print(f"[⚠️ Could not delete frame blob {blob_name}: {e}]")
+
+def frame_image_url(jpeg_bytes, uploaded=None, sas_ttl=None):
+    """
+    URL to send for a frame: a blob SAS URL when frame storage is configured,
+    otherwise an inline base64 data URL. Uploaded blob names are appended to
+    `uploaded` so the caller can delete them with delete_frame_blobs().
+    """
+    if BlobServiceClient is not None and AZURE_STORAGE_CONNECTION_STRING:
+        try:
+            url, blob_name = upload_frame_to_blob(jpeg_bytes, sas_ttl)
+            if uploaded is not None:
+                uploaded.append(blob_name)
+            return url
+        except Exception as e:
+            print(f"[⚠️ Blob upload failed, sending frame inline: {e}]")
+    return f"data:image/jpeg;base64,{base64.b64encode(jpeg_bytes).decode('ascii')}"
+
+def dhash(frame):
+    """64-bit difference hash of a BGR frame, used to spot near-duplicate frames."""
+    cv2 = _import_cv2()
+    gray = cv2.cvtColor(cv2.resize(frame, (9, 8), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+    return int.from_bytes(np.packbits(gray[:, 1:] > gray[:, :-1]).tobytes(), "big")
+
+def build_frame_prompt(user_question, frame_number=None, timestamp_ms=None):
+    if frame_number is not None and timestamp_ms is not None:
+        return f"Frame {frame_number} @ {timestamp_ms} ms\nQuery: {user_question}"
+    return f"Query: {user_question}"
+
+def build_frame_messages(image_url, prompt_text):
+    return [
+        {
+            "role": "system",
+            "content": FRAME_SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": [
                 {
-                    "role": "system",
-                    "content": "You are an expert retail shelf analyst that provides accurate, image-based product insights from shelf photos."
+                    "type": "text",
+                    "text": prompt_text
                 },
                 {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": prompt_text
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
+                    "type": "image_url",
+                    "image_url": {
+                        "url": image_url,
+                        "detail": "low"
+                    }
                 }
-            ],
-            max_tokens=2048,
-            temperature=0.1,
-            top_p=1.0,
-            model=AZURE_OPENAI_DEPLOYMENT_NAME,
-            timeout=30  # Add 30 second timeout to prevent hanging
-        )
+            ]
+        }
+    ]
+
+def cached_completion(key_parts, make_call):
+    """
+    Return make_call()'s text, cached on disk under a hash of key_parts
+    (str/bytes) when AZURE_OPENAI_RESPONSE_CACHE_DIR is set.
+    """
+    if not RESPONSE_CACHE_DIR:
+        return make_call()
+
+    hasher = _cache_hasher()
+    for part in key_parts:
+        hasher.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        hasher.update(b"\0")
+    key = hasher.hexdigest()
+
+    cache_path = Path(RESPONSE_CACHE_DIR) / key[:2] / key
+    if cache_path.exists():
+        return cache_path.read_text(encoding="utf-8")
+
+    result = make_call()
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    cache_path.write_text(result, encoding="utf-8")
+    return result
+
+def extract_products_from_image(image_path, user_question, frame_number=None, timestamp_ms=None, jpeg_bytes=None):
+    try:
+        # Check if API credentials are properly loaded
+        if not all([AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_DEPLOYMENT_NAME, 
+                   AZURE_OPENAI_API_VERSION, AZURE_OPENAI_API_KEY]):
+            return "Error: Azure OpenAI API credentials are missing. Please check your .env file."
 
-        return response.choices[0].message.content.strip()
+        if jpeg_bytes is None:
+            with open(image_path, "rb") as img_file:
+                jpeg_bytes = img_file.read()
+
+        prompt_text = build_frame_prompt(user_question, frame_number, timestamp_ms)
+
+        def request_completion():
+            uploaded = []
+            try:
+                response = get_client().chat.completions.create(
+                    messages=build_frame_messages(frame_image_url(jpeg_bytes, uploaded), prompt_text),
+                    max_tokens=2048,
+                    temperature=0.1,
+                    top_p=1.0,
+                    model=AZURE_OPENAI_DEPLOYMENT_NAME,
+                    timeout=30  # Add 30 second timeout to prevent hanging
+                )
+            finally:
+                delete_frame_blobs(uploaded)
+            return response.choices[0].message.content.strip()
+
+        return cached_completion([AZURE_OPENAI_DEPLOYMENT_NAME, prompt_text, jpeg_bytes], request_completion)
 
     except Exception as e:
         error_type = str(type(e).__name__)
@@ -105,81 +360,299 @@ User Query: {user_question}
             print(f"[⚠️ Skipping frame {frame_number} due to error: {error_type}: {error_message}]")
             return f"[Skipped frame {frame_number} due to error: {error_type}]"
 
-def analyze_video_for_query(video_path, user_question, frame_interval=23):
+def parse_frame_group_response(text):
+    """Map frame number -> answer from a multi-frame JSON response; empty on malformed output."""
+    match = JSON_OBJECT_RE.search(text)
+    if not match:
+        return {}
+    try:
+        data = json.loads(match.group(0))
+        return {
+            int(item["frame"]): str(item["answer"]).strip()
+            for item in data.get("frames", [])
+            if str(item.get("answer", "")).strip()
+        }
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return {}
+
+def extract_products_from_frame_group(frames, user_question):
+    """
+    Analyze several (frame_index, timestamp_ms, jpeg_bytes) frames in one
+    multi-image completion. Frames missing from the model's answer are
+    retried individually, so one response is always returned per frame.
+    """
+    answers = {}
+    if len(frames) > 1 and all([AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_DEPLOYMENT_NAME,
+                                AZURE_OPENAI_API_VERSION, AZURE_OPENAI_API_KEY]):
+        prompt_text = f"{FRAME_GROUP_INSTRUCTIONS}\nQuery: {user_question}"
+
+        def request_completion():
+            uploaded = []
+            try:
+                content = [{"type": "text", "text": prompt_text}]
+                for frame_index, timestamp_ms, jpeg_bytes in frames:
+                    content.append({"type": "text", "text": f"Frame {frame_index} @ {timestamp_ms} ms:"})
+                    content.append({
+                        "type": "image_url",
+                        "image_url": {"url": frame_image_url(jpeg_bytes, uploaded), "detail": "low"}
+                    })
+                response = get_client().chat.completions.create(
+                    messages=[
+                        {"role": "system", "content": FRAME_GROUP_SYSTEM_PROMPT},
+                        {"role": "user", "content": content}
+                    ],
+                    max_tokens=min(512 * len(frames), 4096),
+                    temperature=0.1,
+                    top_p=1.0,
+                    model=AZURE_OPENAI_DEPLOYMENT_NAME,
+                    timeout=60
+                )
+            finally:
+                delete_frame_blobs(uploaded)
+            return response.choices[0].message.content.strip()
+
+        key_parts = [AZURE_OPENAI_DEPLOYMENT_NAME, FRAME_GROUP_SYSTEM_PROMPT, prompt_text]
+        for frame_index, timestamp_ms, jpeg_bytes in frames:
+            key_parts.extend([frame_index, timestamp_ms, jpeg_bytes])
+        try:
+            answers = parse_frame_group_response(cached_completion(key_parts, request_completion))
+        except Exception as e:
+            print(f"[⚠️ Multi-frame request failed, retrying frames individually: {type(e).__name__}: {e}]")
+
+    return [
+        answers.get(frame_index) or extract_products_from_image(
+            image_path=None,
+            user_question=user_question,
+            frame_number=frame_index,
+            timestamp_ms=timestamp_ms,
+            jpeg_bytes=jpeg_bytes
+        )
+        for frame_index, timestamp_ms, jpeg_bytes in frames
+    ]
+
+def extract_products_from_frames_batch(frames, user_question):
+    """
+    Analyze sampled frames through a single Azure OpenAI Batch API job.
+
+    Meant for offline analysis: the job is billed at the batch rate but may
+    take a long time to complete. Returns one response per (frame_index,
+    timestamp_ms, jpeg_bytes) tuple, in input order.
+    """
+    client = get_client()
+    uploaded = []
+    jsonl = io.BytesIO()
+    for frame_index, timestamp_ms, jpeg_bytes in frames:
+        jsonl.write(json.dumps({
+            "custom_id": f"frame-{frame_index}",
+            "method": "POST",
+            "url": "/chat/completions",
+            "body": {
+                "model": AZURE_OPENAI_DEPLOYMENT_NAME,
+                "messages": build_frame_messages(
+                    frame_image_url(jpeg_bytes, uploaded, BATCH_FRAME_SAS_TTL),
+                    build_frame_prompt(user_question, frame_index, timestamp_ms)
+                ),
+                "max_tokens": 2048,
+                "temperature": 0.1,
+                "top_p": 1.0
+            }
+        }).encode("utf-8"))
+        jsonl.write(b"\n")
+    jsonl.seek(0)
+
+    try:
+        batch_file = client.files.create(file=("frames.jsonl", jsonl), purpose="batch")
+        batch = client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/chat/completions",
+            completion_window=BATCH_COMPLETION_WINDOW
+        )
+
+        delay = 5
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(delay)
+            delay = min(delay * 2, BATCH_MAX_POLL_SECONDS)
+            batch = client.batches.retrieve(batch.id)
+    finally:
+        # The job has read every frame (or never will); the blobs are no longer needed
+        delete_frame_blobs(uploaded)
+
+    responses = {}
+    if batch.status == "completed" and batch.output_file_id:
+        output = client.files.content(batch.output_file_id).text
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            body = (result.get("response") or {}).get("body") or {}
+            choices = body.get("choices") or []
+            if choices:
+                responses[result["custom_id"]] = choices[0]["message"]["content"].strip()
+    else:
+        print(f"[⚠️ Batch job {batch.id} finished with status: {batch.status}]")
+
+    return [
+        responses.get(f"frame-{frame_index}", f"[Skipped frame {frame_index} due to batch error]")
+        for frame_index, _, _ in frames
+    ]
+
+def _sampling_stride(fps, frame_interval, target_fps):
+    """Frames between samples: fps / target_fps when a target rate is given, else frame_interval"""
+    if target_fps and fps > 0:
+        return max(1, int(fps / target_fps))
+    return frame_interval
+
+def _sample_frames_decord(video_path, frame_interval, target_fps=None):
+    cv2 = _import_cv2()
+    reader = VideoReader(video_path, ctx=cpu(0))
+    fps = reader.get_avg_fps()
+    indices = list(range(0, len(reader), _sampling_stride(fps, frame_interval, target_fps)))
+
+    def frames():
+        # Seek-based batches: only the requested frames are decoded
+        for start in range(0, len(indices), DECORD_BATCH_SIZE):
+            batch_indices = indices[start:start + DECORD_BATCH_SIZE]
+            batch = reader.get_batch(batch_indices).asnumpy()
+            for frame_index, rgb_frame in zip(batch_indices, batch):
+                yield frame_index, cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2BGR)
+
+    return fps, len(reader), frames()
+
+def _sample_frames_opencv(video_path, frame_interval, target_fps=None):
+    cv2 = _import_cv2()
     cap = cv2.VideoCapture(video_path)
     fps = cap.get(cv2.CAP_PROP_FPS)
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    frame_interval = _sampling_stride(fps, frame_interval, target_fps)
+
+    def frames():
+        frame_index = 0
+        next_sampled_index = 0
+        try:
+            while cap.isOpened():
+                # grab() only advances the demuxer; frames are decoded on retrieve()
+                if not cap.grab():
+                    break
+
+                if frame_index == next_sampled_index:
+                    next_sampled_index += frame_interval
+                    ret, frame = cap.retrieve()
+                    if ret:
+                        yield frame_index, frame
+
+                frame_index += 1
+        finally:
+            cap.release()
+
+    return fps, total_frames, frames()
+
+def sample_video_frames(video_path, frame_interval, target_fps=None):
+    """
+    Return (fps, total_frames, frames) where frames yields (frame_index, bgr_frame)
+    for every frame_interval-th frame (or about target_fps frames per second, if given).
+    Uses decord when installed, else OpenCV.
+    """
+    if VideoReader is not None:
+        try:
+            return _sample_frames_decord(video_path, frame_interval, target_fps)
+        except Exception as e:
+            print(f"[⚠️ decord could not open {video_path}, falling back to OpenCV: {e}]")
+    return _sample_frames_opencv(video_path, frame_interval, target_fps)
+
+def analyze_video_for_query(video_path, user_question, frame_interval=23, use_batch_api=USE_BATCH_API):
+    # Still images are a single frame: answer directly, without opening a
+    # video decoder or making a separate summary call
+    if video_path.lower().endswith(IMAGE_EXTENSIONS):
+        response = extract_products_from_image(image_path=video_path, user_question=user_question)
+        return _finalize_result(user_question, response, f"🖼 Image:\n{response}", [])
+
+    fps, total_frames, frames = sample_video_frames(video_path, frame_interval, SAMPLE_TARGET_FPS)
 
     frame_responses = []
     product_timestamps = []
-    frame_index = 0
-
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        if frame_index % frame_interval == 0:
-            with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as temp_image_file:
-                temp_filename = temp_image_file.name
-                cv2.imwrite(temp_filename, frame)
-
-            timestamp_ms = int((frame_index / fps) * 1000)
-
-            response = extract_products_from_image(
-                image_path=temp_filename,
-                user_question=user_question,
-                frame_number=frame_index,
-                fps=fps
-            )
-
-            frame_responses.append(f"🖼 Frame {frame_index} ({timestamp_ms} ms):\n{response}")
-
-            # if "not visible" not in response.lower() and "not found" not in response.lower():
-            #     product_timestamps.append(timestamp_ms)
-            # === Heuristics to detect valid frames ===
-            response_clean = response.lower()
-
-            # Only include confident detections
-            keywords_present = any(keyword in response_clean for keyword in
-                                   ["located", "visible", "is on", "can be seen", "placed", "sitting", "present",
-                                    "seen"])
-            uncertain_phrases = any(phrase in response_clean for phrase in
-                                    ["not visible", "not found", "unclear", "could be", "might be", "probably"])
-
-            # Skip last few frames if likely false positive
-            video_duration_ms = (total_frames / fps) * 1000
-            end_threshold_ms = video_duration_ms * 0.9  # last 10%
-
-            if keywords_present and not uncertain_phrases:
-                if timestamp_ms < end_threshold_ms or "end" not in response_clean:
-                    product_timestamps.append(timestamp_ms)
-
-            os.remove(temp_filename)
-
-        frame_index += 1
-
-    cap.release()
+    sampled_frames = []  # (frame_index, position in unique_frames)
+    unique_frames = []  # (position in sampled_frames, jpeg_bytes) actually sent to the API
+    recent_hashes = OrderedDict()  # dhash -> position in unique_frames
+
+    for frame_index, frame in frames:
+        frame_hash = dhash(frame)
+        position = next(
+            (pos for known_hash, pos in recent_hashes.items()
+             if bin(known_hash ^ frame_hash).count("1") <= DHASH_MAX_DISTANCE),
+            None
+        )
+        if position is None:
+            position = len(unique_frames)
+            unique_frames.append((len(sampled_frames), encode_frame(frame)))
+            recent_hashes[frame_hash] = position
+            if len(recent_hashes) > DHASH_CACHE_SIZE:
+                recent_hashes.popitem(last=False)
+
+        sampled_frames.append((frame_index, position))
+
+    # Timestamps for every sampled frame, computed in one vectorized pass
+    frame_indices = np.fromiter((index for index, _ in sampled_frames), dtype=np.int64, count=len(sampled_frames))
+    timestamps_ms = (frame_indices * (1000.0 / fps)).astype(np.int64).tolist()
+    unique_requests = [
+        (sampled_frames[sample_position][0], timestamps_ms[sample_position], jpeg_bytes)
+        for sample_position, jpeg_bytes in unique_frames
+    ]
+
+    if use_batch_api:
+        unique_responses = extract_products_from_frames_batch(unique_requests, user_question)
+    else:
+        # Frame requests are network-bound: pack frames into multi-image
+        # requests and dispatch the groups concurrently. executor.map keeps
+        # the results in frame order.
+        frame_groups = [
+            unique_requests[start:start + FRAMES_PER_REQUEST]
+            for start in range(0, len(unique_requests), FRAMES_PER_REQUEST)
+        ]
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+            unique_responses = [
+                response
+                for group_responses in executor.map(
+                    lambda group: extract_products_from_frame_group(group, user_question), frame_groups
+                )
+                for response in group_responses
+            ]
+
+    # Skip last few frames if likely false positive
+    video_duration_ms = (total_frames / fps) * 1000
+    end_threshold_ms = video_duration_ms * 0.9  # last 10%
+
+    for (frame_index, position), timestamp_ms in zip(sampled_frames, timestamps_ms):
+        response = unique_responses[position]
+
+        # The summarizer only needs the gist of each frame; cap what it is sent
+        frame_responses.append(f"🖼 Frame {frame_index} ({timestamp_ms} ms):\n{response[:SUMMARY_FRAME_RESPONSE_CHARS]}")
+
+        # if "not visible" not in response.lower() and "not found" not in response.lower():
+        #     product_timestamps.append(timestamp_ms)
+        # === Heuristics to detect valid frames ===
+        # Only include confident detections
+        keywords_present = POSITIVE_PHRASES_RE.search(response) is not None
+        uncertain_phrases = UNCERTAIN_PHRASES_RE.search(response) is not None
+
+        if keywords_present and not uncertain_phrases:
+            if timestamp_ms < end_threshold_ms or END_PHRASE_RE.search(response) is None:
+                product_timestamps.append(timestamp_ms)
 
     combined_text = "\n\n".join(frame_responses)
 
-    summary_prompt = f"""
-You are a summarization assistant. Based on the following frame-wise analysis of a shelf video, write a summary of where the requested product(s) appear.
-- If the query refers to a **specific product**, then at the end of the summary add a new line in this format exactly:
-  `product_name = <Product Name>`
-- If no product is mentioned, skip this line.
+    # No confident detection in any frame: skip the summary round-trip
+    video_meta = {"fps": fps, "frame_count": total_frames, "duration_ms": video_duration_ms}
+    if not product_timestamps:
+        return _finalize_result(user_question, NOT_FOUND_SUMMARY, combined_text, [], video_meta)
 
-Return ONLY the summary and the product name line if applicable.
-
-📌 User Query: {user_question}
+    summary_prompt = "".join([
+        SUMMARY_PROMPT_HEADER,
+        "📌 User Query: ", user_question,
+        "\n\n🔍 Frame Responses:\n", combined_text,
+        SUMMARY_PROMPT_FOOTER
+    ])
 
-🔍 Frame Responses:
-{combined_text}
-
-✏️ Return a helpful, natural language summary for the user. Do not include any extra information (about frames and frame numbers) other than the answer to the asked query.
-"""
-
-    summary_response = client.chat.completions.create(
+    summary_response = get_client().chat.completions.create(
         messages=[
             {"role": "system", "content": "You are a summarization expert for retail shelf video analytics."},
             {"role": "user", "content": summary_prompt}
@@ -196,32 +669,45 @@ Return ONLY the summary and the product name line if applicable.
     # Final return: summary without timestamps, but timestamps available separately
     if not product_timestamps or "not visible" in base_summary.lower():
         product_timestamps = []
-    if video_path.lower().endswith((".jpg", ".jpeg", ".png")):
-        response = extract_products_from_image(image_path=video_path, user_question=user_question)
-        evaluation_result = evaluate_summary_accuracy(user_question, base_summary, combined_text)
-        print("\n--- Evaluation Summary ---")
-        print(evaluation_result)
-        product_name = extract_product_name(base_summary)
-        if not product_name or product_name.lower() == "unknown":
-            product_name = extract_product_name(user_question)
-        print(f"[🛍️ Extracted Product Name]: {product_name}")
-        return {
-            "final_summary": base_summary,
-            "timestamps": product_timestamps,
-            "product_name": product_name
-        }
-    evaluation_result = evaluate_summary_accuracy(user_question, base_summary, combined_text)
-    print("\n--- Evaluation Summary ---")
-    print(evaluation_result)
+    return _finalize_result(user_question, base_summary, combined_text, product_timestamps, video_meta)
+
+def _finalize_result(user_question, base_summary, combined_text, product_timestamps, video_meta=None):
+    if EVAL_ENABLED:
+        evaluate_summary_accuracy_in_background(user_question, base_summary, combined_text)
     product_name = extract_product_name(base_summary)
     if not product_name or product_name.lower() == "unknown":
         product_name = extract_product_name(user_question)
     print(f"[🛍️ Extracted Product Name]: {product_name}")
-    return {
+    result = {
         "final_summary": base_summary,
         "timestamps": product_timestamps,
         "product_name": product_name
     }
+    # Videos also report fps/frame_count/duration_ms so callers needn't reopen the file
+    if video_meta:
+        result.update(video_meta)
+    return result
+
+def evaluate_summary_accuracy_in_background(user_question, generated_summary, frame_analysis_text):
+    """
+    Run evaluate_summary_accuracy off the request path and print the result
+    when it completes; the evaluation is a debugging signal and nothing
+    returned to the caller depends on it.
+    """
+    def print_evaluation(future):
+        try:
+            evaluation_result = future.result()
+        except Exception as e:
+            print(f"[⚠️ Summary evaluation failed: {type(e).__name__}: {e}]")
+            return
+        print("\n--- Evaluation Summary ---")
+        print(evaluation_result)
+
+    future = _background_executor.submit(
+        evaluate_summary_accuracy, user_question, generated_summary, frame_analysis_text
+    )
+    future.add_done_callback(print_evaluation)
+    return future
 
 def evaluate_summary_accuracy(user_question, generated_summary, frame_analysis_text):
     evaluation_prompt = f"""
@@ -254,14 +740,16 @@ Accuracy Score (0–100)%: <score>
 Evaluation Summary: <brief explanation of factual correctness and completeness>
 """
 
-    eval_response = client.chat.completions.create(
-        messages=[
-            {"role": "system", "content": "You are an unbiased evaluator that assesses summary quality based on provided evidence."},
-            {"role": "user", "content": evaluation_prompt}
-        ],
-        max_tokens=300,
-        temperature=0.2,
-        model=AZURE_OPENAI_DEPLOYMENT_NAME  # Or use "gpt-4o" if preferred
-    )
+    def request_evaluation():
+        eval_response = get_client().chat.completions.create(
+            messages=[
+                {"role": "system", "content": "You are an unbiased evaluator that assesses summary quality based on provided evidence."},
+                {"role": "user", "content": evaluation_prompt}
+            ],
+            max_tokens=300,
+            temperature=0.2,
+            model=AZURE_OPENAI_DEPLOYMENT_NAME  # Or use "gpt-4o" if preferred
+        )
+        return eval_response.choices[0].message.content.strip()
 
-    return eval_response.choices[0].message.content.strip()
+    return cached_completion([AZURE_OPENAI_DEPLOYMENT_NAME, evaluation_prompt], request_evaluation)
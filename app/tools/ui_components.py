@@ -4,6 +4,7 @@ Provides clean, modern UI elements similar to Amazon/Flipkart
 """
 
 import streamlit as st
+from html import escape
 from typing import Dict, List, Optional
 
 class PlatformBadge:
@@ -104,6 +105,8 @@ class ProductCard:
         """
         # Extract data with defaults
         title = product_data.get('title', 'Product Title')[:60] + "..." if len(product_data.get('title', '')) > 60 else product_data.get('title', 'Product Title')
+        # Escaped only after truncation, so the cut can't split an entity
+        title = escape(title)
         price = product_data.get('price', '₹N/A')
         rating = product_data.get('rating', '4.0')
         review_count = product_data.get('review_count', '0')
@@ -137,6 +140,21 @@ class ProductCard:
         
         return f'<div>{card_html}</div>'
 
+    @staticmethod
+    def create_cards_bulk(products: List[Dict], card_wrapper: str = '{}') -> str:
+        """
+        Render every product card into a single HTML string, ranked from 1
+
+        Args:
+            products: Product information dictionaries, in display order
+            card_wrapper: Format string each card is placed into (e.g. a grid cell div)
+        """
+        create_card = ProductCard.create_card
+        return ''.join(
+            card_wrapper.format(create_card(product_data, rank))
+            for rank, product_data in enumerate(products, 1)
+        )
+
 
 class ComparisonTable:
     """Professional comparison table component"""
@@ -168,6 +186,7 @@ class ComparisonTable:
     def create_best_deal_banner(product_data: Dict) -> str:
         """Create best deal banner"""
         title = product_data.get('title', 'Product')[:40] + "..." if len(product_data.get('title', '')) > 40 else product_data.get('title', 'Product')
+        title = escape(title)
         price = product_data.get('price', '₹N/A')
         platform = product_data.get('platform', 'default')
         platform_name = PlatformBadge.PLATFORM_COLORS.get(platform, PlatformBadge.PLATFORM_COLORS['default'])['name']
@@ -196,7 +215,7 @@ def create_card(product_data: Dict, rank: int, show_comparison: bool = True, is_
 
     # Extract data with fallbacks
     raw_title = product_data.get('title', '')
-    title = (raw_title[:60] + "...") if raw_title and len(raw_title) > 60 else raw_title
+    title = escape((raw_title[:60] + "...") if raw_title and len(raw_title) > 60 else raw_title)
     price = product_data.get('price', '')
     rating = product_data.get('rating', '')
     review_count = product_data.get('review_count', '')
@@ -100,7 +100,7 @@ def main():
             cards_html.append(card)
         
         print(f"   ✅ Generated {len(cards_html)} product cards")
-        print(f"   ✅ Total HTML size: {sum(len(card) for card in cards_html)} chars")
+        print(f"   ✅ Total HTML size: {sum(map(len, cards_html))} chars")
         
         # Check if all cards are clean
         all_clean = all(
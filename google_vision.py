@@ -5,13 +5,68 @@ Enhanced visual product matching with Google's AI
 """
 
 import os
+import asyncio
 import requests
-import base64
-from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import copy
+import gzip
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from itertools import chain
+from urllib.parse import quote
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from dataclasses import dataclass, field
 import json
+import re
+import sys
 
-@dataclass
+try:
+    # Optional: SIMD base64 encoder with the same API as the stdlib module
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+try:
+    # Optional: Aho-Corasick automaton for multi-brand text matching
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+try:
+    # Optional: faster JSON for request bodies and the (often tens of KB) Vision responses
+    from orjson import dumps as _json_dumps, loads as _json_loads
+except ImportError:
+    def _json_dumps(data) -> bytes:
+        return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+    try:
+        from jiter import from_json as _jiter_from_json
+
+        def _json_loads(data: bytes):
+            # Vision responses repeat the same keys ("score", "name", ...) many times
+            return _jiter_from_json(data, cache_mode="keys")
+    except ImportError:
+        _json_loads = json.loads
+
+try:
+    # Optional: persistent second tier for the detection cache
+    import diskcache
+except ImportError:
+    diskcache = None
+
+try:
+    # Optional: only needed for the async detection methods
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# __slots__ dataclasses (no per-instance __dict__) need Python 3.10+
+_DATACLASS_OPTIONS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**_DATACLASS_OPTIONS)
 class ProductDetection:
     """Product detection result from Google Vision"""
     name: str
@@ -21,13 +76,209 @@ class ProductDetection:
     description: str
     attributes: Dict[str, str]
     bounding_box: Optional[Dict] = None
+    # (brand, category, name words), lowercased; filled on first use by match_keys()
+    _match_keys: Optional[Tuple[str, str, frozenset]] = field(default=None, init=False, repr=False, compare=False)
+    
+    def match_keys(self) -> Tuple[str, str, frozenset]:
+        """Lowercased brand, category and name words, computed once per product"""
+        if self._match_keys is None:
+            self._match_keys = (self.brand.lower(), self.category.lower(), frozenset(self.name.lower().split()))
+        return self._match_keys
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait on Vision before also starting the Azure OpenAI fallback (async path)
+FALLBACK_HEDGE_SECONDS = float(os.getenv("GOOGLE_VISION_HEDGE_SECONDS", "2.0"))
+
+# images:annotate accepts at most 16 images per call
+MAX_IMAGES_PER_REQUEST = 16
+
+# The features are the same for every image: serialize them once and splice each image in.
+# PRODUCT_SEARCH is billed separately and only returns results against a product set,
+# so it is requested only when one is configured.
+_PRODUCT_SEARCH_FEATURE = {
+    "type": "PRODUCT_SEARCH",
+    "maxResults": 10
+}
+_FEATURES = [
+    {
+        "type": "OBJECT_LOCALIZATION",
+        "maxResults": 10
+    },
+    {
+        "type": "TEXT_DETECTION",
+        "maxResults": 10
+    }
+]
+
+def _build_image_request_prefix(product_set: Optional[str]) -> bytes:
+    """Serialized start of one "requests" entry, up to the image object"""
+    if not product_set:
+        return b'{"features":' + _json_dumps(_FEATURES) + b',"image":'
+    image_context = {"productSearchParams": {"productSet": product_set, "productCategories": ["general-v1"]}}
+    return (b'{"features":' + _json_dumps([_PRODUCT_SEARCH_FEATURE] + _FEATURES)
+            + b',"imageContext":' + _json_dumps(image_context) + b',"image":')
+
+_IMAGE_REQUEST_SUFFIX = b"}"
+_REQUEST_PREFIX = b'{"requests":['
+_REQUEST_SUFFIX = b"]}"
+
+# Partial response: ask Vision to return only the fields the parser reads. OCR text comes
+# back as the single fullTextAnnotation string: the per-word textAnnotations entries and the
+# OCR page/block layout are never sent, so the response is a fraction of the size and much
+# less JSON has to be decoded.
+_RESPONSE_FIELDS = (
+    "responses("
+    "error,"
+    "productSearchResults/results(score,product),"
+    "localizedObjectAnnotations(name,score,boundingPoly),"
+    "fullTextAnnotation/text"
+    ")"
+)
+_RESPONSE_FIELDS_PARAM = quote(_RESPONSE_FIELDS, safe="")
+
+# Request bodies are gzip-compressed JSON
+_REQUEST_HEADERS = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+GZIP_LEVEL = 5
+
+# Parsed Vision results keyed by image content hash, shared by all detectors
+_DETECTION_CACHE_SIZE = 512
+_detection_cache: Dict[str, List[ProductDetection]] = OrderedDict()
+_detection_cache_lock = threading.Lock()
+
+# Second, persistent tier (needs diskcache): survives restarts, so re-processed planograms
+# don't pay for the API again. Entries expire so Vision's product data stays reasonably fresh.
+VISION_CACHE_DIR = os.getenv("GOOGLE_VISION_CACHE_DIR", ".vision_cache")
+VISION_CACHE_TTL_SECONDS = 7 * 24 * 3600
+_disk_cache = None
+_disk_cache_lock = threading.Lock()
+
+def _get_disk_cache():
+    """Open the on-disk cache on first use; None when diskcache is missing or disabled"""
+    global _disk_cache
+    if diskcache is None or not VISION_CACHE_DIR:
+        return None
+    if _disk_cache is None:
+        with _disk_cache_lock:
+            if _disk_cache is None:
+                _disk_cache = diskcache.Cache(VISION_CACHE_DIR, size_limit=2 ** 30)
+    return _disk_cache
+
+def _memory_cache_put(key: str, products: List[ProductDetection]) -> None:
+    with _detection_cache_lock:
+        _detection_cache[key] = [copy.copy(p) for p in products]
+        _detection_cache.move_to_end(key)
+        while len(_detection_cache) > _DETECTION_CACHE_SIZE:
+            _detection_cache.popitem(last=False)
+
+def _cache_get(key: str) -> Optional[List[ProductDetection]]:
+    """Return copies of the cached detections (callers mutate confidence)"""
+    with _detection_cache_lock:
+        products = _detection_cache.get(key)
+        if products is not None:
+            _detection_cache.move_to_end(key)
+            return [copy.copy(p) for p in products]
+    
+    disk_cache = _get_disk_cache()
+    if disk_cache is None:
+        return None
+    try:
+        products = disk_cache.get(key)
+    except Exception as e:
+        logger.warning("Vision disk cache read failed: %s", e)
+        return None
+    if products is None:
+        return None
+    # Unpickled lists are already private copies; promote to the memory tier
+    _memory_cache_put(key, products)
+    return products
+
+def _cache_put(key: str, products: List[ProductDetection]) -> None:
+    _memory_cache_put(key, products)
+    disk_cache = _get_disk_cache()
+    if disk_cache is not None:
+        try:
+            disk_cache.set(key, products, expire=VISION_CACHE_TTL_SECONDS)
+        except Exception as e:
+            logger.warning("Vision disk cache write failed: %s", e)
+
+def _unique_products(products: Iterable[Optional[ProductDetection]]) -> Iterator[ProductDetection]:
+    """Skip Nones and repeats of a (name, brand) pair, keeping the first occurrence"""
+    # The same product often shows up via object localization and text
+    seen_keys = set()
+    for product in products:
+        if product is None:
+            continue
+        key = (product.name.lower(), product.brand.lower())
+        if key not in seen_keys:
+            seen_keys.add(key)
+            yield product
+
+# Common product brands (lowercase) and categories
+_BRAND_PATTERNS = (
+    ("tide", "Detergent"),
+    ("surf", "Detergent"),
+    ("ariel", "Detergent"),
+    ("vim", "Dishwash"),
+    ("dettol", "Antiseptic"),
+    ("lux", "Soap"),
+    ("dove", "Soap"),
+    ("pantene", "Shampoo"),
+    ("head & shoulders", "Shampoo"),
+    ("colgate", "Toothpaste"),
+    ("oral-b", "Toothpaste"),
+    ("maggi", "Food"),
+    ("nestle", "Food"),
+    ("coca-cola", "Beverage"),
+    ("pepsi", "Beverage"),
+)
+_BRAND_SET = frozenset(brand for brand, _ in _BRAND_PATTERNS)
+# (brand, display name, category), with display names computed once
+_BRAND_ENTRIES = tuple((brand, brand.title(), category) for brand, category in _BRAND_PATTERNS)
+
+def _build_brand_matcher(brands):
+    """
+    Build a function yielding every brand found in a lowercased text in one pass:
+    an Aho-Corasick automaton when pyahocorasick is installed, else one regex alternation
+    """
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for brand in brands:
+            automaton.add_word(brand, brand)
+        automaton.make_automaton()
+        return lambda text: (brand for _, brand in automaton.iter(text))
+    
+    # Longest first so a brand is never shadowed by a shorter one at the same position
+    pattern = re.compile("|".join(map(re.escape, sorted(brands, key=len, reverse=True))))
+    return lambda text: (match.group(0) for match in pattern.finditer(text))
+
+_BRAND_MATCHER = _build_brand_matcher(_BRAND_SET)
+
+# A line of free-text analysis with at least two words, surrounding whitespace excluded
+_PRODUCT_LINE_RE = re.compile(r"^[^\S\n]*((\S+)[^\S\n]+[^\n]*?\S)[^\S\n]*$", re.MULTILINE)
 
 class GoogleVisionProductDetector:
     """Google Vision API integration for product detection"""
     
-    def __init__(self):
+    def __init__(self, product_set: Optional[str] = None):
         self.api_key = os.getenv("GOOGLE_CLOUD_API_KEY")
         self.vision_endpoint = "https://vision.googleapis.com/v1/images:annotate"
+        # Full product set resource name (projects/.../productSets/...); enables PRODUCT_SEARCH
+        self.product_set = product_set or os.getenv("GOOGLE_VISION_PRODUCT_SET")
+        self._image_request_prefix = _build_image_request_prefix(self.product_set)
+        # aiohttp sessions are bound to the event loop they were created on
+        self._async_session = None
+        self._async_session_loop = None
+        
+        # Reuse one keep-alive connection pool for all synchronous requests
+        self._session = requests.Session()
+        self._session.mount("https://", HTTPAdapter(
+            pool_connections=8,
+            pool_maxsize=16,
+            max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504),
+                              allowed_methods=None)
+        ))
+        self._session.headers.update({"Connection": "keep-alive"})
         
     def detect_products_in_image(self, image_path: str) -> List[ProductDetection]:
         """
@@ -40,91 +291,271 @@ class GoogleVisionProductDetector:
             List of detected products with details
         """
         try:
-            # Encode image to base64
-            image_base64 = self._encode_image(image_path)
-            
-            # Prepare the request
-            request_data = {
-                "requests": [
-                    {
-                        "image": {
-                            "content": image_base64
-                        },
-                        "features": [
-                            {
-                                "type": "PRODUCT_SEARCH",
-                                "maxResults": 10
-                            },
-                            {
-                                "type": "OBJECT_LOCALIZATION",
-                                "maxResults": 10
-                            },
-                            {
-                                "type": "TEXT_DETECTION",
-                                "maxResults": 10
-                            },
-                            {
-                                "type": "LOGO_DETECTION",
-                                "maxResults": 10
-                            }
-                        ]
-                    }
-                ]
-            }
+            # Read the image once: the bytes feed both the cache key and the request
+            cache_key, image_bytes = self._load_image(image_path)
+            cached = _cache_get(cache_key)
+            if cached is not None:
+                return cached
             
             # Make API request
-            response = requests.post(
-                f"{self.vision_endpoint}?key={self.api_key}",
-                headers={"Content-Type": "application/json"},
-                json=request_data,
+            response = self._session.post(
+                self._request_url(),
+                headers=_REQUEST_HEADERS,
+                data=self._encode_request_body(self._build_request(image_path, image_bytes)),
                 timeout=30
             )
             
             if response.status_code == 200:
-                return self._parse_vision_response(response.json())
+                products = self._parse_vision_response(_json_loads(response.content))
+                _cache_put(cache_key, products)
+                return products
             else:
-                print(f"❌ Google Vision API error: {response.status_code}")
+                logger.error("Google Vision API error: %s", response.status_code)
                 return self._fallback_product_detection(image_path)
                 
         except Exception as e:
-            print(f"❌ Google Vision error: {str(e)}")
+            logger.error("Google Vision error: %s", e)
             return self._fallback_product_detection(image_path)
     
-    def _encode_image(self, image_path: str) -> str:
-        """Encode image file to base64"""
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
-    
-    def _parse_vision_response(self, response: Dict) -> List[ProductDetection]:
-        """Parse Google Vision API response into ProductDetection objects"""
-        products = []
+    def detect_products_in_images(self, image_paths: List[str], batch_size: int = MAX_IMAGES_PER_REQUEST) -> List[List[ProductDetection]]:
+        """
+        Detect products in several images, sending up to 16 images per images:annotate call
         
-        if "responses" not in response:
-            return products
+        Args:
+            image_paths: Paths (or gs:// URIs) of the images
+            batch_size: Images per request, capped at the API limit of 16
+            
+        Returns:
+            One list of detected products per image, in input order
+        """
+        batch_size = max(1, min(batch_size, MAX_IMAGES_PER_REQUEST))
+        results: List[Optional[List[ProductDetection]]] = [None] * len(image_paths)
         
-        vision_response = response["responses"][0]
+        # (index, cache_key, image_request) for every image not already cached
+        pending = []
+        for index, image_path in enumerate(image_paths):
+            try:
+                cache_key, image_bytes = self._load_image(image_path)
+            except Exception as e:
+                logger.error("Google Vision error: %s", e)
+                results[index] = self._fallback_product_detection(image_path)
+                continue
+            cached = _cache_get(cache_key)
+            if cached is not None:
+                results[index] = cached
+            else:
+                pending.append((index, cache_key, self._build_image_request(image_path, image_bytes)))
         
-        # Extract product search results
-        if "productSearchResults" in vision_response:
-            product_results = vision_response["productSearchResults"]
-            for result in product_results.get("results", []):
-                product = self._create_product_from_search_result(result)
-                if product:
-                    products.append(product)
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            try:
+                response = self._session.post(
+                    self._request_url(),
+                    headers=_REQUEST_HEADERS,
+                    data=self._encode_request_body(
+                        _REQUEST_PREFIX + b",".join(entry for _, _, entry in batch) + _REQUEST_SUFFIX
+                    ),
+                    timeout=30
+                )
+                if response.status_code != 200:
+                    logger.error("Google Vision API error: %s", response.status_code)
+                    responses = []
+                else:
+                    responses = _json_loads(response.content).get("responses", [])
+            except Exception as e:
+                logger.error("Google Vision error: %s", e)
+                responses = []
+            
+            # Responses come back in request order; images the API failed on fall back individually
+            for position, (index, cache_key, _) in enumerate(batch):
+                vision_response = responses[position] if position < len(responses) else None
+                if vision_response is None or "error" in vision_response:
+                    results[index] = self._fallback_product_detection(image_paths[index])
+                    continue
+                products = self._parse_image_response(vision_response)
+                _cache_put(cache_key, products)
+                results[index] = products
         
-        # Extract from object localization
-        if "localizedObjectAnnotations" in vision_response:
-            objects = vision_response["localizedObjectAnnotations"]
-            for obj in objects:
-                product = self._create_product_from_object(obj)
-                if product:
-                    products.append(product)
+        return results
+    
+    async def detect_products_in_image_async(self, image_path: str) -> List[ProductDetection]:
+        """
+        Async variant of detect_products_in_image for detecting many images concurrently
         
-        # Extract from text and logos
-        text_products = self._extract_products_from_text(vision_response)
-        products.extend(text_products)
+        Args:
+            image_path: Path to the image file
+            
+        Returns:
+            List of detected products with details
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            # File read, hashing, base64 and gzip all block; run them on the default executor
+            # so other images' requests stay in flight meanwhile
+            cache_key, cached, body = await loop.run_in_executor(None, self._prepare_request, image_path)
+        except Exception as e:
+            logger.error("Google Vision error: %s", e)
+            return await loop.run_in_executor(None, self._fallback_product_detection, image_path)
+        if cached is not None:
+            return cached
         
-        return products
+        # Hedge: if Vision is slow, start the fallback alongside it and take the first usable answer
+        vision_task = asyncio.ensure_future(self._post_async(cache_key, body))
+        done, _ = await asyncio.wait({vision_task}, timeout=FALLBACK_HEDGE_SECONDS)
+        if done:
+            products = vision_task.result()
+            if products is not None:
+                return products
+            # The fallback is a blocking Azure OpenAI call; keep it off the event loop
+            return await loop.run_in_executor(None, self._fallback_product_detection, image_path)
+        
+        fallback_task = loop.run_in_executor(None, self._fallback_product_detection, image_path)
+        pending = {vision_task, fallback_task}
+        fallback_products: List[ProductDetection] = []
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            vision_products = vision_task.result() if vision_task in done else None
+            if fallback_task in done:
+                fallback_products = fallback_task.result()
+            if vision_products is not None:
+                if fallback_task in done:
+                    # Both finished together: keep everything, without duplicates
+                    return list(_unique_products(chain(vision_products, fallback_products)))
+                # A worker thread can't be interrupted; the fallback's result is simply dropped
+                fallback_task.cancel()
+                return vision_products
+            if fallback_products:
+                vision_task.cancel()
+                return fallback_products
+        return fallback_products
+    
+    async def _post_async(self, cache_key: str, body: bytes) -> Optional[List[ProductDetection]]:
+        """POST one prepared request; the parsed products, or None if Vision failed"""
+        try:
+            session = await self._get_async_session()
+            async with session.post(
+                self._request_url(),
+                headers=_REQUEST_HEADERS,
+                data=body,
+                timeout=aiohttp.ClientTimeout(total=30)
+            ) as response:
+                if response.status == 200:
+                    products = self._parse_vision_response(_json_loads(await response.read()))
+                    _cache_put(cache_key, products)
+                    return products
+                logger.error("Google Vision API error: %s", response.status)
+        except Exception as e:
+            logger.error("Google Vision error: %s", e)
+        return None
+    
+    async def detect_many(self, image_paths: List[str]) -> List[List[ProductDetection]]:
+        """Detect products in several images concurrently, preserving input order"""
+        return await asyncio.gather(*(self.detect_products_in_image_async(p) for p in image_paths))
+    
+    def detect_many_sync(self, image_paths: List[str]) -> List[List[ProductDetection]]:
+        """Blocking detect_many() for callers without an event loop; runs on a fresh loop each call"""
+        async def run():
+            try:
+                return await self.detect_many(image_paths)
+            finally:
+                await self.aclose()
+        return asyncio.run(run())
+    
+    async def _get_async_session(self):
+        """Return the aiohttp session for the running event loop, creating it on first use per loop"""
+        if aiohttp is None:
+            raise RuntimeError("aiohttp is required for async detection: pip install aiohttp")
+        loop = asyncio.get_running_loop()
+        if (self._async_session is None or self._async_session.closed
+                or self._async_session_loop is not loop):
+            self._async_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=32))
+            self._async_session_loop = loop
+        return self._async_session
+    
+    async def aclose(self):
+        """Close the aiohttp session, if it belongs to the running event loop"""
+        if (self._async_session is not None and not self._async_session.closed
+                and self._async_session_loop is asyncio.get_running_loop()):
+            await self._async_session.close()
+        self._async_session = None
+        self._async_session_loop = None
+    
+    def _request_url(self) -> str:
+        """images:annotate URL with the API key and the response field mask"""
+        return f"{self.vision_endpoint}?key={self.api_key}&fields={_RESPONSE_FIELDS_PARAM}"
+    
+    def _prepare_request(self, image_path: str) -> Tuple[str, Optional[List[ProductDetection]], Optional[bytes]]:
+        """Return (cache_key, cached_products, request_body); the body is only built on a cache miss"""
+        cache_key, image_bytes = self._load_image(image_path)
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            return cache_key, cached, None
+        return cache_key, None, self._encode_request_body(self._build_request(image_path, image_bytes))
+    
+    def _build_request(self, image_path: str, image_bytes: Optional[bytes]) -> bytes:
+        """Build the images:annotate JSON for a local image (bytes) or a gs:// URI (no bytes)"""
+        return _REQUEST_PREFIX + self._build_image_request(image_path, image_bytes) + _REQUEST_SUFFIX
+    
+    def _build_image_request(self, image_path: str, image_bytes: Optional[bytes]) -> bytes:
+        """Build one entry of the "requests" array, splicing the image into the prebuilt template"""
+        if image_bytes is None:
+            # Vision reads GCS objects directly: no upload and no base64 step
+            image = _json_dumps({"source": {"imageUri": image_path}})
+        else:
+            # base64 never needs JSON escaping, so it goes in as-is
+            image = b'{"content":"' + self._encode_image(image_bytes) + b'"}'
+        return self._image_request_prefix + image + _IMAGE_REQUEST_SUFFIX
+    
+    def _read_image(self, image_path: str) -> bytes:
+        """Read the raw image bytes"""
+        with open(image_path, "rb") as image_file:
+            return image_file.read()
+    
+    def _load_image(self, image_path: str) -> Tuple[str, Optional[bytes]]:
+        """Return (cache_key, image_bytes); bytes are None for gs:// URIs, keyed by the URI"""
+        if image_path.startswith("gs://"):
+            return self._cache_key(image_path.encode("utf-8")), None
+        image_bytes = self._read_image(image_path)
+        return self._cache_key(image_bytes), image_bytes
+    
+    def _encode_request_body(self, request_json: bytes) -> bytes:
+        """Gzip the request JSON; base64 image content shrinks back toward its raw size"""
+        return gzip.compress(request_json, compresslevel=GZIP_LEVEL)
+    
+    def _cache_key(self, image_bytes: bytes) -> str:
+        """Content hash of the image, so identical images hit the cache regardless of path"""
+        hasher = hashlib.blake2b(image_bytes, digest_size=16)
+        if self.product_set:
+            # Product search results depend on the set, so keep them apart from plain results
+            hasher.update(self.product_set.encode("utf-8"))
+        return hasher.hexdigest()
+    
+    def _encode_image(self, image_bytes: bytes) -> bytes:
+        """Encode image bytes to base64, kept as bytes for splicing into the request JSON"""
+        return base64.b64encode(image_bytes)
+    
+    def _parse_vision_response(self, response: Dict) -> List[ProductDetection]:
+        """Parse Google Vision API response into ProductDetection objects"""
+        if "responses" not in response:
+            return []
+        
+        return self._parse_image_response(response["responses"][0])
+    
+    def _parse_image_response(self, vision_response: Dict) -> List[ProductDetection]:
+        """Parse one entry of the "responses" array into ProductDetection objects"""
+        return list(self._iter_products(vision_response))
+    
+    def _iter_products(self, vision_response: Dict) -> Iterator[ProductDetection]:
+        """Yield the products of one response entry from every source, in a single pass"""
+        return _unique_products(chain(
+            # Extract product search results
+            map(self._create_product_from_search_result,
+                vision_response.get("productSearchResults", {}).get("results", ())),
+            # Extract from object localization
+            map(self._create_product_from_object, vision_response.get("localizedObjectAnnotations", ())),
+            # Extract from text
+            self._extract_products_from_text(vision_response)
+        ))
     
     def _create_product_from_search_result(self, result: Dict) -> Optional[ProductDetection]:
         """Create ProductDetection from product search result"""
@@ -166,48 +597,27 @@ class GoogleVisionProductDetector:
         except Exception:
             return None
     
-    def _extract_products_from_text(self, vision_response: Dict) -> List[ProductDetection]:
+    def _extract_products_from_text(self, vision_response: Dict) -> Iterator[ProductDetection]:
         """Extract product information from detected text"""
-        products = []
-        
-        # Get all detected text
-        text_annotations = vision_response.get("textAnnotations", [])
-        if not text_annotations:
-            return products
-        
-        full_text = text_annotations[0].get("description", "").lower()
+        # Get all detected text (the same string as textAnnotations[0].description)
+        full_text = vision_response.get("fullTextAnnotation", {}).get("text", "")
+        if len(full_text) < 3:
+            # Shorter than any brand name
+            return
+        full_text = full_text.lower()
         
-        # Common product brands and categories
-        brand_patterns = {
-            "tide": "Detergent",
-            "surf": "Detergent", 
-            "ariel": "Detergent",
-            "vim": "Dishwash",
-            "dettol": "Antiseptic",
-            "lux": "Soap",
-            "dove": "Soap",
-            "pantene": "Shampoo",
-            "head & shoulders": "Shampoo",
-            "colgate": "Toothpaste",
-            "oral-b": "Toothpaste",
-            "maggi": "Food",
-            "nestle": "Food",
-            "coca-cola": "Beverage",
-            "pepsi": "Beverage"
-        }
-        
-        for brand, category in brand_patterns.items():
-            if brand in full_text:
-                products.append(ProductDetection(
-                    name=f"{brand.title()} Product",
-                    brand=brand.title(),
+        # Single pass over the text for all brands; report in _BRAND_PATTERNS order
+        found = set(_BRAND_MATCHER(full_text))
+        for brand, display_name, category in _BRAND_ENTRIES:
+            if brand in found:
+                yield ProductDetection(
+                    name=f"{display_name} Product",
+                    brand=display_name,
                     category=category,
                     confidence=0.8,
                     description=f"Detected {brand} brand product",
                     attributes={"source": "text_detection"}
-                ))
-        
-        return products
+                )
     
     def _extract_brand(self, product_info: Dict) -> str:
         """Extract brand information from product data"""
@@ -244,13 +654,13 @@ class GoogleVisionProductDetector:
                 "What products do you see in this image? List the brand names and product types."
             )
             
-            if result and result.get("summary"):
+            # The analysis returns plain text; errors come back as "Error: ..." / "[Skipped ..." messages
+            if result and not result.startswith(("Error:", "[Skipped")):
                 # Parse the summary to create product detections
-                summary = result["summary"]
-                return self._parse_text_to_products(summary)
+                return self._parse_text_to_products(result)
             
         except Exception as e:
-            print(f"❌ Fallback detection error: {str(e)}")
+            logger.error("Fallback detection error: %s", e)
         
         return []
     
@@ -259,49 +669,52 @@ class GoogleVisionProductDetector:
         products = []
         
         # Simple parsing logic - can be enhanced
-        lines = text.split('\n')
-        for line in lines:
-            line = line.strip()
+        # Each match is a stripped line of at least two words: (line, first word)
+        for match in _PRODUCT_LINE_RE.finditer(text):
+            line = match.group(1)
             if len(line) > 5:  # Minimum length
-                # Try to identify brand and product type
-                words = line.split()
-                if len(words) >= 2:
-                    products.append(ProductDetection(
-                        name=line,
-                        brand=words[0] if words else "Unknown",
-                        category="Product",
-                        confidence=0.6,
-                        description=line,
-                        attributes={"source": "text_analysis"}
-                    ))
+                products.append(ProductDetection(
+                    name=line,
+                    brand=match.group(2),
+                    category="Product",
+                    confidence=0.6,
+                    description=line,
+                    attributes={"source": "text_analysis"}
+                ))
+                if len(products) == 5:  # Limit to top 5
+                    break
         
-        return products[:5]  # Limit to top 5
+        return products
     
     def find_similar_products(self, detected_products: List[ProductDetection], search_query: str) -> List[ProductDetection]:
         """Find products similar to detected ones that match search query"""
         similar_products = []
         
+        # Query-side values are the same for every product; compute them once
         search_lower = search_query.lower()
+        search_word_list = search_lower.split()
+        search_words = set(search_word_list)
+        search_word_count = len(search_word_list)
         
         for product in detected_products:
             # Calculate similarity score
             similarity_score = 0.0
             
+            # Lowercased fields are memoized on the product, so repeat queries reuse them
+            brand_lower, category_lower, name_words = product.match_keys()
+            
             # Check brand match
-            if product.brand.lower() in search_lower:
+            if brand_lower in search_lower:
                 similarity_score += 0.4
             
             # Check category match
-            if product.category.lower() in search_lower:
+            if category_lower in search_lower:
                 similarity_score += 0.3
             
             # Check name match
-            name_words = product.name.lower().split()
-            search_words = search_lower.split()
-            
-            common_words = set(name_words) & set(search_words)
+            common_words = search_words.intersection(name_words)
             if common_words:
-                similarity_score += 0.3 * (len(common_words) / len(search_words))
+                similarity_score += 0.3 * (len(common_words) / search_word_count)
             
             if similarity_score > 0.5:  # Threshold for similarity
                 product.confidence = similarity_score
@@ -337,15 +750,18 @@ def enhanced_product_detection(image_path: str, query: str = "") -> Tuple[List[P
     
     # Generate summary
     if products:
-        summary = f"🔍 **Detected {len(products)} products:**\n\n"
-        for i, product in enumerate(products[:3], 1):
-            summary += f"{i}. **{product.name}** ({product.brand})\n"
-            summary += f"   Category: {product.category} | Confidence: {product.confidence:.1%}\n\n"
+        parts = [f"🔍 **Detected {len(products)} products:**\n\n"]
+        parts.extend(
+            f"{i}. **{product.name}** ({product.brand})\n"
+            f"   Category: {product.category} | Confidence: {product.confidence:.1%}\n\n"
+            for i, product in enumerate(products[:3], 1)
+        )
         
         if len(products) > 3:
-            summary += f"...and {len(products) - 3} more products detected.\n\n"
+            parts.append(f"...and {len(products) - 3} more products detected.\n\n")
         
-        summary += "💡 **Ask me to search for prices** of any of these products!"
+        parts.append("💡 **Ask me to search for prices** of any of these products!")
+        summary = "".join(parts)
     else:
         summary = "❌ No products clearly detected in this image. Try uploading a clearer image or ask a specific question."
     
@@ -1,16 +1,49 @@
 import streamlit as st
+import streamlit.components.v1 as components
+import bisect
 from app.analyze import analyze_video_for_query
 import tempfile
 import os
-import base64
+import re
+import shutil
 import cv2
+import numpy as np
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from PIL import Image
 from app.mcp_server import invoke_tool
 from app.tools.price_compare import compare_prices, advanced_product_search, get_quantity_suggestions
+from app.tools.enhanced_price_scraper import enhanced_product_search
+from app.tools.quantity_matcher import get_product_category
+from app.tools.ui_components import ComparisonTable, ProductCard, FilteringInfo
 
-st.markdown("""
+try:
+    # Optional: C-accelerated HTML escaping (installed alongside Jinja2)
+    from markupsafe import escape as _escape_html
+except ImportError:
+    from html import escape as _escape_html
+
+# Summary cleanup
+_PRODUCT_NAME_LINE_RE = re.compile(r'\n\s*product_name\s*=\s*[^\n]*')
+_PRODUCT_NAME_RE = re.compile(r'product_name\s*=\s*[^\n]*')
+_BLANK_LINE_RE = re.compile(r'\n\s*\n')
+
+try:
+    # Optional: PyAV binds libav directly - faster, frame-accurate seeks than OpenCV's FFmpeg shim
+    import av
+except ImportError:
+    av = None
+
+# The product grid renders inside its own components.html iframe, so its styles ship with
+# the grid document rather than being injected into the page
+PRODUCT_GRID_STYLE = """
 <style>
+body {
+    margin: 0;
+    font-family: "Source Sans Pro", sans-serif;
+}
 .product-container {
     display: grid;
     grid-template-columns: repeat(auto-fill, minmax(300px, 1fr));
@@ -25,7 +58,7 @@ st.markdown("""
     box-shadow: 0 2px 6px rgba(0,0,0,0.05);
 }
 </style>
-""", unsafe_allow_html=True)
+"""
 
 
 def format_timestamp(ms):
@@ -35,20 +68,382 @@ def format_timestamp(ms):
     subseconds = int((total_seconds - int(total_seconds)) * 100)
     return f"{minutes:02}:{seconds:02}.{subseconds:02}"
 
+def format_timestamps_batch(ms_values):
+    """format_timestamp for many values: the arithmetic runs in NumPy, only the formatting per item"""
+    total_seconds = np.asarray(ms_values, dtype=np.float64) / 1000.0
+    minutes = (total_seconds // 60).astype(np.int64)
+    seconds = (total_seconds % 60).astype(np.int64)
+    subseconds = ((total_seconds - np.trunc(total_seconds)) * 100).astype(np.int64)
+    return [
+        f"{m:02}:{s:02}.{ss:02}"
+        for m, s, ss in zip(minutes.tolist(), seconds.tolist(), subseconds.tolist())
+    ]
+
+# Frames before the target the OpenCV path seeks to, then grab()s forward from
+FRAME_SEEK_LEAD = 30
+# Width frames are downscaled to when pre-extracted for the timestamp viewer
+CACHED_FRAME_MAX_WIDTH = 640
+# JPEG quality of the encoded viewer frames
+CACHED_FRAME_JPEG_QUALITY = 85
+# Viewer frames kept by cached_frame_jpeg; least recently used entries are evicted first
+CACHED_FRAME_MAX_ENTRIES = 64
+
+# Cached PyAV containers not used for this long are closed
+VIDEO_CONTAINER_TTL_SECONDS = 3600
+
+class VideoContainerCache:
+    """
+    PyAV containers shared across reruns and sessions, one per file version (path, mtime),
+    so repeated seeks skip demuxer setup. Each entry's lock serializes seek+decode, since a
+    container isn't thread-safe, and a container is only ever closed once nobody is using it.
+    """
+
+    def __init__(self, ttl_seconds):
+        self._ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    @contextmanager
+    def checkout(self, video_path, mtime):
+        """Yield the container for this file version, holding its lock for the seek+decode"""
+        entry = self._acquire((video_path, mtime))
+        try:
+            with entry["lock"]:
+                yield entry["container"]
+        finally:
+            self._release(entry)
+
+    def discard(self, video_path):
+        """Close every cached version of video_path; one still in use closes when its caller is done"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == video_path]:
+                entry = self._entries.pop(key)
+                entry["discarded"] = True
+                if not entry["users"]:
+                    entry["container"].close()
+
+    def _acquire(self, key):
+        now = time.monotonic()
+        with self._lock:
+            # Close containers idle past the ttl (never one that is checked out)
+            expired = [k for k, e in self._entries.items() if not e["users"] and now - e["last_used"] > self._ttl]
+            for expired_key in expired:
+                self._entries.pop(expired_key)["container"].close()
+            entry = self._entries.get(key)
+            if entry is None:
+                container = av.open(key[0])
+                # Slice threading decodes a single frame faster; frame threading would add per-seek delay
+                container.streams.video[0].thread_type = "SLICE"
+                entry = self._entries[key] = {
+                    "container": container, "lock": threading.Lock(), "users": 0, "discarded": False,
+                }
+            entry["users"] += 1
+            entry["last_used"] = now
+            return entry
+
+    def _release(self, entry):
+        with self._lock:
+            entry["users"] -= 1
+            entry["last_used"] = time.monotonic()
+            if entry["discarded"] and not entry["users"]:
+                entry["container"].close()
+
+@st.cache_resource(show_spinner=False)
+def video_containers():
+    """The process-wide VideoContainerCache (the script body reruns, this does not)"""
+    return VideoContainerCache(VIDEO_CONTAINER_TTL_SECONDS)
+
+def release_video_container(video_path):
+    """Close the cached containers for video_path so the file can be deleted; opens nothing"""
+    if av is not None:
+        video_containers().discard(video_path)
+
+def _extract_frame_pyav(video_path, timestamp_ms):
+    with video_containers().checkout(video_path, os.path.getmtime(video_path)) as container:
+        stream = container.streams.video[0]
+        target_pts = int(timestamp_ms / 1000 / stream.time_base) + (stream.start_time or 0)
+        # Seek to the keyframe at or before the target, then decode forward to it
+        container.seek(target_pts, stream=stream, any_frame=False, backward=True)
+        frame = None
+        for frame in container.decode(stream):
+            if frame.pts is not None and frame.pts >= target_pts:
+                break
+        return frame.to_ndarray(format="bgr24") if frame is not None else None
+
+class FrameUnavailable(Exception):
+    """No frame could be decoded at the requested timestamp"""
+
 def extract_frame_at_timestamp(video_path, timestamp_ms):
+    """BGR frame at timestamp_ms; raises FrameUnavailable (or the decoder's own error) instead of returning None"""
+    frame = None
+    if av is not None:
+        try:
+            frame = _extract_frame_pyav(video_path, timestamp_ms)
+        except av.error.FFmpegError as e:
+            print(f"[⚠️ PyAV could not decode {video_path}, falling back to OpenCV: {e}]")
+            frame = _extract_frame_opencv(video_path, timestamp_ms)
+    else:
+        frame = _extract_frame_opencv(video_path, timestamp_ms)
+    if frame is None:
+        raise FrameUnavailable(timestamp_ms)
+    return frame
+
+def _extract_frame_opencv(video_path, timestamp_ms):
+    cap = cv2.VideoCapture(video_path)
     try:
-        cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
             return None
-        cap.set(cv2.CAP_PROP_POS_MSEC, int(timestamp_ms))
-        ret, frame = cap.read()
-        cap.release()
-        if not ret:
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if fps > 0:
+            # Frame indices are more reliable than POS_MSEC on VFR video: land a little before
+            # the target, grab() (no decode) up to it and only decode the target frame
+            target_frame = int(round(timestamp_ms * fps / 1000.0))
+            start_frame = max(target_frame - FRAME_SEEK_LEAD, 0)
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+            ret = all(cap.grab() for _ in range(target_frame - start_frame + 1))
+            frame = cap.retrieve()[1] if ret else None
+        else:
+            cap.set(cv2.CAP_PROP_POS_MSEC, int(timestamp_ms))
+            ret, frame = cap.read()
+        if not ret or frame is None:
             return None
-        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        # Kept in BGR: frames only ever leave here through cv2.imencode
+        return frame
+    finally:
+        cap.release()
+
+def _shrink_frame(frame):
+    """Downscale a frame for the viewer cache (frames are shown at 320px wide)"""
+    height, width = frame.shape[:2]
+    if width <= CACHED_FRAME_MAX_WIDTH:
+        return frame
+    scale = CACHED_FRAME_MAX_WIDTH / width
+    return cv2.resize(frame, (CACHED_FRAME_MAX_WIDTH, int(height * scale)), interpolation=cv2.INTER_AREA)
+
+def _extract_frames_batch_pyav(video_path, timestamps_ms):
+    frames_by_ts = {}
+    with video_containers().checkout(video_path, os.path.getmtime(video_path)) as container:
+        stream = container.streams.video[0]
+        offset = stream.start_time or 0
+        targets = iter([(int(ts / 1000 / stream.time_base) + offset, ts) for ts in timestamps_ms])
+        target = next(targets, None)
+        if target is None:
+            return frames_by_ts
+        container.seek(target[0], stream=stream, any_frame=False, backward=True)
+        for frame in container.decode(stream):
+            if frame.pts is None or frame.pts < target[0]:
+                continue
+            bgr = _shrink_frame(frame.to_ndarray(format="bgr24"))
+            # One decoded frame can satisfy several targets
+            while target is not None and frame.pts >= target[0]:
+                frames_by_ts[target[1]] = bgr
+                target = next(targets, None)
+            if target is None:
+                break
+    return frames_by_ts
+
+def _extract_frames_batch_opencv(video_path, timestamps_ms):
+    frames_by_ts = {}
+    cap = cv2.VideoCapture(video_path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if not cap.isOpened() or fps <= 0:
+            return frames_by_ts
+        targets = [(int(round(ts * fps / 1000.0)), ts) for ts in timestamps_ms]
+        position = max(targets[0][0] - FRAME_SEEK_LEAD, 0)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, position)
+        for target_frame, ts in targets:
+            # grab() forward without decoding; position is the index of the next frame
+            while position <= target_frame:
+                if not cap.grab():
+                    return frames_by_ts
+                position += 1
+            ret, frame = cap.retrieve()
+            if ret:
+                frames_by_ts[ts] = _shrink_frame(frame)
+    finally:
+        cap.release()
+    return frames_by_ts
+
+def encode_frame_jpeg(frame):
+    """JPEG bytes for a BGR frame; st.image serves bytes as-is instead of re-encoding an array"""
+    ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, CACHED_FRAME_JPEG_QUALITY])
+    return buf.tobytes() if ok else None
+
+# Must be a Streamlit cache: the script body is re-executed on every rerun, so a
+# functools.lru_cache declared here would be rebuilt each time and never hit
+@st.cache_data(max_entries=CACHED_FRAME_MAX_ENTRIES, show_spinner=False)
+def cached_frame_jpeg(video_path, timestamp_ms, mtime):
+    """
+    Viewer frame as JPEG, memoized per (file version, timestamp); downscaled like the batch cache.
+    Failures raise rather than return None, so st.cache_data doesn't keep them.
+    """
+    frame = extract_frame_at_timestamp(video_path, timestamp_ms)
+    jpeg = encode_frame_jpeg(_shrink_frame(frame))
+    if jpeg is None:
+        raise FrameUnavailable(timestamp_ms)
+    return jpeg
+
+def extract_frames_batch(video_path, timestamps_ms):
+    """
+    Decode the frames for many timestamps (sorted ascending) in one forward pass, instead of
+    reopening and re-seeking the video per timestamp. Returns {timestamp_ms: bgr_frame}.
+    """
+    if not timestamps_ms:
+        return {}
+    try:
+        if av is not None:
+            try:
+                return _extract_frames_batch_pyav(video_path, timestamps_ms)
+            except av.error.FFmpegError as e:
+                print(f"[⚠️ PyAV could not decode {video_path}, falling back to OpenCV: {e}]")
+        return _extract_frames_batch_opencv(video_path, timestamps_ms)
     except Exception as e:
-        st.error(f"🚨 Exception while extracting frame: {str(e)}")
-        return None
+        print(f"[⚠️ Could not pre-extract frames: {e}]")
+        return {}
+
+@st.cache_data(show_spinner=False)
+def get_video_metadata(video_path, mtime):
+    """(fps, frame_count, duration_ms), read once per file version instead of on every rerun"""
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    duration_ms = (frame_count / fps) * 1000.0 if fps > 0 else 1
+    cap.release()
+    return fps, frame_count, duration_ms
+
+@st.cache_data(show_spinner=False)
+def render_timeline_markers(timestamps, duration_ms):
+    """Marker HTML for the timeline strip, positioned as a percentage of the video duration"""
+    ts_arr = np.asarray(timestamps, dtype=np.float64)
+    lefts = np.minimum(ts_arr * (100.0 / duration_ms), 100.0)
+    return "".join(
+        f'<div class="marker" style="left:{left:.4f}%;" title="{title}"></div>'
+        for left, title in zip(lefts.tolist(), format_timestamps_batch(ts_arr))
+    )
+
+# Timeline strip styles; reruns only splice the per-video marker divs in front of this constant
+TIMELINE_STYLE = """\
+<style>
+.timeline-strip {
+    position: relative;
+    width: 100%;
+    height: 12px;
+    margin-bottom: 8px;
+    background-color: #333;
+    border-radius: 3px;
+}
+.marker {
+    position: absolute;
+    top: 3px;
+    width: 4px;
+    height: 6px;
+    background-color: yellow;
+    box-shadow: 0 0 4px rgba(255, 255, 0, 0.9);
+}
+.marker:hover::after {
+    content: attr(title);
+    position: absolute;
+    top: -28px;
+    left: -10px;
+    background: black;
+    color: white;
+    padding: 2px 5px;
+    font-size: 10px;
+    border-radius: 4px;
+    white-space: nowrap;
+}
+.debug-line {
+    position: absolute;
+    width: 1px;
+    height: 12px;
+    background-color: red;
+    opacity: 0.9;
+}
+</style>
+"""
+
+class NoSearchResults(Exception):
+    """A search came back empty (enhanced_product_search also returns [] when SerpAPI fails)"""
+
+@st.cache_data(ttl=600, show_spinner=False)
+def cached_product_search(product_name, quantity, sort_by, limit):
+    """
+    enhanced_product_search, memoized for 10 minutes so identical searches skip SerpAPI.
+    Raises NoSearchResults instead of returning an empty list, since exceptions aren't cached.
+    """
+    products = enhanced_product_search(
+        product_name=product_name,
+        quantity=quantity,
+        sort_by=sort_by,
+        limit=limit
+    )
+    if not products:
+        raise NoSearchResults(product_name)
+    return escape_product_fields(products)
+
+# The card and banner components shorten titles and escape them after the cut themselves;
+# pre-escaping would let the cut land inside an entity and count it toward the length
+_SELF_ESCAPED_FIELDS = frozenset(("title",))
+
+def escape_product_fields(products):
+    """HTML-escape string fields once, so the card/banner templates can splice values as-is"""
+    return [
+        {
+            key: str(_escape_html(value)) if isinstance(value, str) and key not in _SELF_ESCAPED_FIELDS else value
+            for key, value in product.items()
+        }
+        for product in products
+    ]
+
+_PRODUCT_CARD_TEMPLATE = '<div class="product-card">{}</div>'
+
+# Visible height of the product grid iframe; further rows scroll inside it
+PRODUCT_ROW_HEIGHT = 500
+PRODUCT_GRID_MAX_ROWS = 2
+
+@st.cache_data(show_spinner=False)
+def render_product_cards(product_cards):
+    """Product grid document; identical result lists (e.g. a cached search) re-render from cache"""
+    return (
+        PRODUCT_GRID_STYLE
+        + '<div class="product-container">'
+        + ProductCard.create_cards_bulk(product_cards, _PRODUCT_CARD_TEMPLATE)
+        + '</div>'
+    )
+
+# Widget changes inside a fragment rerun only the fragment, so scrolling through the
+# timestamp list does not rebuild the video, timeline and price sections on every change
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
+
+@_fragment
+def timestamp_viewer(file_path, timestamps):
+    """Timestamp selectbox plus the frame shown for it"""
+    # Options are positions into timestamps, so no label -> timestamp dict is built or hashed
+    labels = format_timestamps_batch(timestamps)
+    selected_idx = st.selectbox("Select timestamp", range(len(timestamps)), format_func=labels.__getitem__)
+    selected_display = labels[selected_idx]
+
+    if st.button("🔍 Show Frame at Timestamp"):
+        timestamp_ms = timestamps[selected_idx]
+        frames_cache = st.session_state.get("frames_cache")
+        frame = None
+        if frames_cache and frames_cache["file_path"] == file_path:
+            frame = frames_cache["frames"].get(timestamp_ms)
+        if frame is None:
+            try:
+                frame = cached_frame_jpeg(
+                    file_path, timestamp_ms, os.path.getmtime(file_path)
+                )
+            except FrameUnavailable:
+                pass
+            except Exception as e:
+                st.error(f"🚨 Exception while extracting frame: {str(e)}")
+        if frame is not None:
+            st.image(frame, caption=f"🖼 Frame at {selected_display}", width=320)
+        else:
+            st.warning(f"❌ No frame available at {selected_display}")
 
 # === Streamlit UI ===
 # st.set_page_config(page_title="Planogram Vision", layout="wide")
@@ -84,9 +479,9 @@ st.markdown("""
 
 st.markdown("---")
 # === Session State ===
-for key in ["file_path", "file_type", "timestamps", "summary", "file_base64"]:
-    if key not in st.session_state:
-        st.session_state[key] = None if key in ["file_path", "file_type"] else ""
+SESSION_DEFAULTS = {"file_path": None, "file_type": None, "timestamps": "", "summary": ""}
+if "_initialized" not in st.session_state:
+    st.session_state.update(SESSION_DEFAULTS, _initialized=True)
 
 # # === File Upload ===
 # st.markdown("### 📤 Upload File (Image or Video)")
@@ -110,6 +505,27 @@ for key in ["file_path", "file_type", "timestamps", "summary", "file_base64"]:
 # === File Upload + Previous Files Dropdown ===
 UPLOAD_DIR = "uploaded_files"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+MEDIA_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv", ".jpg", ".jpeg", ".png")
+
+@st.cache_data(ttl=5, show_spinner=False)
+def list_uploads(dir_mtime):
+    """Sorted media files in UPLOAD_DIR; keyed on the directory mtime so new files show up at once"""
+    with os.scandir(UPLOAD_DIR) as entries:
+        return sorted(e.name for e in entries if e.name.lower().endswith(MEDIA_EXTENSIONS))
+
+@st.cache_resource
+def io_pool():
+    """Process-wide workers for file I/O the UI should not wait on (the script body reruns, this does not)"""
+    return ThreadPoolExecutor(max_workers=2)
+
+def delete_upload(path):
+    """Remove an uploaded file, tolerating one that is already gone"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"[⚠️ Could not delete file {path}: {e}]")
 
 # st.markdown("### 📤 Upload File (Image or Video)")
 #
@@ -133,29 +549,28 @@ with col1:
 
 # === Right Column: Dropdowns stacked ===
 with col2:
-    existing_files = sorted(
-        [f for f in os.listdir(UPLOAD_DIR) if f.lower().endswith((".mp4", "mov", "avi", "mkv", "jpg", "jpeg", "png"))]
-    )
+    existing_files = list_uploads(os.path.getmtime(UPLOAD_DIR))
 
     # Add uploaded file to the dropdown list immediately after saving
     if uploaded_file is not None:
         file_ext = uploaded_file.name.split(".")[-1].lower()
         file_path = os.path.join(UPLOAD_DIR, uploaded_file.name)
 
-        with open(file_path, "wb") as f:
-            file_bytes = uploaded_file.read()
-            f.write(file_bytes)
-
-        file_to_use = file_path
+        # Streamlit reruns the script on every interaction; only write a new/changed upload
+        if not os.path.exists(file_path) or os.path.getsize(file_path) != uploaded_file.size:
+            # Stream to disk in 1 MiB chunks instead of materializing the whole upload as bytes
+            uploaded_file.seek(0)
+            with open(file_path, "wb") as f:
+                shutil.copyfileobj(uploaded_file, f, length=1024 * 1024)
 
         # Add it to the list for the dropdown
         if uploaded_file.name not in existing_files:
-            existing_files.append(uploaded_file.name)
+            bisect.insort(existing_files, uploaded_file.name)
 
     # Dropdown always rendered AFTER potential file save
     selected_prev_file = st.selectbox(
         "Or choose from existing files",
-        ["-- None --"] + sorted(existing_files),
+        ["-- None --"] + existing_files,
         key="selected_media_dropdown"
     )
 
@@ -173,57 +588,36 @@ with col2:
     # === Preview Section ===
     if preview_file_path:
         with st.expander("📂 Preview Selected File", expanded=False):
-            try:
-                with open(preview_file_path, "rb") as f:
-                    encoded = base64.b64encode(f.read()).decode("utf-8")
-
-                if preview_file_ext in ["jpg", "jpeg", "png"]:
-                    st.image(f"data:image/{preview_file_ext};base64,{encoded}", width=150)
-
-                elif preview_file_ext in ["mp4", "mov", "avi", "mkv"]:
-                    mime_type = f"video/{'mp4' if preview_file_ext == 'mp4' else 'quicktime'}"
-                    video_html = f"""
-                    <video width="150" controls>
-                      <source src="data:{mime_type};base64,{encoded}" type="{mime_type}">
-                      Your browser does not support the video tag.
-                    </video>
-                    """
-                    st.markdown(video_html, unsafe_allow_html=True)
-            except Exception as e:
-                st.warning(f"Couldn't load preview: {e}")
+            # The expander body runs even when collapsed, and st.image/st.video read the whole
+            # file into Streamlit's media store; only do that when the preview is asked for
+            if st.checkbox("Show preview", key="_show_preview"):
+                try:
+                    if preview_file_ext in ["jpg", "jpeg", "png"]:
+                        st.image(preview_file_path, width=150)
+
+                    elif preview_file_ext in ["mp4", "mov", "avi", "mkv"]:
+                        st.video(preview_file_path)
+                except Exception as e:
+                    st.warning(f"Couldn't load preview: {e}")
 
 file_to_use = None
 file_ext = None
 
 if uploaded_file is not None:
+    # Already saved to UPLOAD_DIR above
     file_ext = uploaded_file.name.split(".")[-1].lower()
-    file_path = os.path.join(UPLOAD_DIR, uploaded_file.name)
-
-    # Save uploaded file to disk (overwrites if changed)
-    with open(file_path, "wb") as f:
-        file_bytes = uploaded_file.read()
-        f.write(file_bytes)
-
-    file_to_use = file_path
+    file_to_use = os.path.join(UPLOAD_DIR, uploaded_file.name)
 
 elif selected_prev_file != "-- None --":
     file_ext = selected_prev_file.split(".")[-1].lower()
     file_to_use = os.path.join(UPLOAD_DIR, selected_prev_file)
 
-# Load and prepare file if selected/uploaded
+# Record the selected/uploaded file; its bytes are never read here, media is served by path
 if file_to_use:
-    try:
-        is_video = file_ext in ["mp4", "mov", "avi", "mkv"]
-        is_image = file_ext in ["jpg", "jpeg", "png"]
-        st.session_state.file_type = "video" if is_video else "image" if is_image else None
-
-        with open(file_to_use, "rb") as f:
-            file_bytes = f.read()
-            st.session_state.file_base64 = base64.b64encode(file_bytes).decode("utf-8")
-
-        st.session_state.file_path = file_to_use
-    except Exception as e:
-        st.error(f"⚠️ Error reading file: {e}")
+    is_video = file_ext in ["mp4", "mov", "avi", "mkv"]
+    is_image = file_ext in ["jpg", "jpeg", "png"]
+    st.session_state.file_type = "video" if is_video else "image" if is_image else None
+    st.session_state.file_path = file_to_use
 
 
 # === Ask Question ===
@@ -238,6 +632,19 @@ if st.button("🚀 Analyze"):
                 st.session_state.result = result
                 st.session_state.summary = result.get("final_summary", "")
                 st.session_state.timestamps = result.get("timestamps", []) if st.session_state.file_type == "video" else []
+                st.session_state.video_meta = {
+                    "file_path": st.session_state.file_path,
+                    "fps": result["fps"],
+                    "frame_count": result["frame_count"],
+                    "duration_ms": result["duration_ms"],
+                } if "duration_ms" in result else None
+                # Decode every detection frame now, in one pass, so the viewer is a dict lookup;
+                # stored as JPEG bytes, which are also far smaller than the arrays in session state
+                frames = extract_frames_batch(st.session_state.file_path, sorted(st.session_state.timestamps))
+                st.session_state.frames_cache = {
+                    "file_path": st.session_state.file_path,
+                    "frames": {ts: encode_frame_jpeg(frame) for ts, frame in frames.items()},
+                }
                 st.success("✅ Analysis complete!")
             except Exception as e:
                 st.error(f"❌ Error during processing: {str(e)}")
@@ -272,12 +679,11 @@ if st.session_state.summary:
     clean_summary = st.session_state.summary
     
     # Remove product_name = ... lines
-    import re
-    clean_summary = re.sub(r'\n\s*product_name\s*=\s*[^\n]*', '', clean_summary)
-    clean_summary = re.sub(r'product_name\s*=\s*[^\n]*', '', clean_summary)
+    clean_summary = _PRODUCT_NAME_LINE_RE.sub('', clean_summary)
+    clean_summary = _PRODUCT_NAME_RE.sub('', clean_summary)
     
     # Clean up extra whitespace and newlines
-    clean_summary = re.sub(r'\n\s*\n', '\n', clean_summary).strip()
+    clean_summary = _BLANK_LINE_RE.sub('\n', clean_summary).strip()
     
     st.write(clean_summary)
 
@@ -290,9 +696,6 @@ if "result" in st.session_state:
 if product_name and product_name.lower() != "unknown":
     st.markdown("### 🛒 Smart Price Agent")
     
-    # Get quantity suggestions
-    from app.tools.quantity_matcher import get_product_category
-    
     # Define quantity suggestions based on product type
     category = get_product_category(product_name)
     if category == 'detergent':
@@ -381,40 +784,34 @@ if product_name and product_name.lower() != "unknown":
             if not os.getenv("SERPAPI_API_KEY"):
                 st.error("❌ SerpAPI key is missing. Please check your .env file.")
             else:
+                enhanced_results = []
                 try:
-                    # Use enhanced search system
-                    from app.tools.enhanced_price_scraper import enhanced_product_search
+                    # Use enhanced search system (cached, so a repeated search skips SerpAPI)
+                    enhanced_results = cached_product_search(
+                        product_name, final_quantity, sort_by, result_count
+                    )
                     
-                    prices = enhanced_product_search(
-                        product_name=product_name, 
-                        quantity=final_quantity, 
-                        sort_by=sort_by, 
-                        limit=result_count
+                    # The results are a plain list: the best deal is its first entry, not an
+                    # extra "🏆" item, so every entry counts
+                    product_total = len(enhanced_results)
+                    
+                    # Display comparison header
+                    header_html = ComparisonTable.create_comparison_header(
+                        product_name, final_quantity, product_total
                     )
+                    st.markdown(header_html, unsafe_allow_html=True)
                     
-                    # Check if there was an error
-                    if len(prices) == 1 and "Error" in prices:
-                        st.error(f"❌ {prices['Error']}")
-                        st.warning("Try again later or check your internet connection.")
-                    else:
-                        # Import new components
-                        from app.tools.ui_components import ComparisonTable, ProductCard, FilteringInfo
-                        
-                        # Display comparison header
-                        header_html = ComparisonTable.create_comparison_header(
-                            product_name, final_quantity, len(prices) - 1 if '🏆' in str(prices) else len(prices)
-                        )
-                        st.markdown(header_html, unsafe_allow_html=True)
-                        
-                        # Show filtering information
-                        filter_info = FilteringInfo.create_filter_summary(
-                            total_found=len(prices),
-                            filtered_count=len(prices) - 1 if '🏆' in str(prices) else len(prices),
-                            target_quantity=final_quantity,
-                            sort_by=sort_choice
-                        )
-                        st.markdown(filter_info, unsafe_allow_html=True)
-                        
+                    # Show filtering information
+                    filter_info = FilteringInfo.create_filter_summary(
+                        total_found=product_total,
+                        filtered_count=product_total,
+                        target_quantity=final_quantity,
+                        sort_by=sort_choice
+                    )
+                    st.markdown(filter_info, unsafe_allow_html=True)
+                    
+                except NoSearchResults:
+                    st.warning("No products found. Try again later or check your internet connection.")
                 except Exception as e:
                     st.error(f"❌ Error fetching prices: {str(e)}")
                     st.warning("SerpAPI request failed. Please try again later.")
@@ -466,71 +863,10 @@ if product_name and product_name.lower() != "unknown":
             #         </div>
             #         """, unsafe_allow_html=True)
                         
-                # Use enhanced price scraper for better results
-                from app.tools.enhanced_price_scraper import enhanced_product_search
-                
-                # Get enhanced results
-                try:
-                    enhanced_results = enhanced_product_search(
-                        product_name=product_name,
-                        quantity=final_quantity,
-                        sort_by=sort_by,
-                        limit=result_count
-                    )
-                    
-                    if "Error" in enhanced_results:
-                        st.error(f"❌ {enhanced_results['Error']}")
-                        # Fall back to original results
-                        enhanced_results = prices
-                except:
-                    # Fall back to original results if enhanced scraper fails
-                    enhanced_results = prices
-                
                 # Display products using new system
-                product_cards = []
-                best_deal_data = None
-                
-                # Handle list return from enhanced_product_search
-                if isinstance(enhanced_results, list):
-                    # New format - direct list of products
-                    product_cards = enhanced_results
-                    # Get best deal (first product after sorting)
-                    if product_cards:
-                        best_deal_data = product_cards[0]
-                elif isinstance(enhanced_results, dict):
-                    # Legacy format - dictionary with keys
-                    for key, value in enhanced_results.items():
-                        if key.startswith("🏆"):
-                            if isinstance(value, dict):
-                                best_deal_data = value
-                            continue
-                        
-                        # Handle both old and new format
-                        if isinstance(value, dict):
-                            # New enhanced format
-                            product_cards.append(value)
-                        else:
-                            # Old format - convert
-                            import re
-                            img_match = re.search(r'<img src="(.*?)"', str(value))
-                            link_match = re.search(r"\[Buy Now\]\((.*?)\)", str(value))
-                            price_match = re.search(r"₹[\d,.]+", str(value))
-                            rating_match = re.search(r"Rating.*?: ([\d.]+)", str(value))
-                            
-                            product_cards.append({
-                                'title': key.split(" - ", 1)[1] if " - " in key else key,
-                                'price': price_match.group(0) if price_match else "₹N/A",
-                                'rating': float(rating_match.group(1)) if rating_match else 4.0,
-                                'review_count': 100,
-                                'image': img_match.group(1) if img_match else "https://via.placeholder.com/150x150.png?text=No+Image",
-                                'link': link_match.group(1) if link_match else "#",
-                                'platform': 'default',
-                                'platform_name': 'Online Store',
-                                'delivery': 'Standard delivery',
-                                'savings': '',
-                                'extracted_quantity': '',
-                                'rank': len(product_cards) + 1
-                            })
+                # enhanced_product_search returns a list of product dicts, best match first
+                product_cards = enhanced_results
+                best_deal_data = product_cards[0] if product_cards else None
                 
                 if product_cards:
                     # Show best deal banner
@@ -544,15 +880,13 @@ if product_name and product_name.lower() != "unknown":
                     # Display product cards in grid
                     # ✅ Display product cards in a full-width responsive grid
                     # ✅ Using correct grid structure for Amazon/Flipkart-like layout
-                    product_cards_html = '<div class="product-container">'
-
-                    for i, product_data in enumerate(product_cards):
-                        card_html = ProductCard.create_card(product_data, i + 1)
-                        product_cards_html += f'<div class="product-card">{card_html}</div>'
-
-                    product_cards_html += '</div>'
-
-                    st.markdown(product_cards_html, unsafe_allow_html=True)
+                    # A plain iframe mounts the cards directly instead of sending a large
+                    # HTML string through the markdown renderer
+                    components.html(
+                        render_product_cards(product_cards),
+                        height=PRODUCT_ROW_HEIGHT * min(len(product_cards), PRODUCT_GRID_MAX_ROWS),
+                        scrolling=True
+                    )
 
                     # Add spacing
                     st.markdown("<br>", unsafe_allow_html=True)
@@ -657,21 +991,20 @@ if product_name and product_name.lower() != "unknown":
 if (
     st.session_state.file_type == "video"
     and st.session_state.file_path
-    and st.session_state.file_base64
     and st.session_state.summary  # ✅ Show only after analysis is done
 ):
     st.markdown("### 📊 Product Detection Timeline & Frame Viewer")
 
-    cap = cv2.VideoCapture(st.session_state.file_path)
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
-    duration_ms = (frame_count / fps) * 1000.0 if fps > 0 else 1
-    cap.release()
+    # The analysis already probed the video; only reopen it if the file changed since
+    meta = st.session_state.get("video_meta")
+    if meta and meta["file_path"] == st.session_state.file_path:
+        duration_ms = meta["duration_ms"]
+    else:
+        fps, frame_count, duration_ms = get_video_metadata(
+            st.session_state.file_path, os.path.getmtime(st.session_state.file_path)
+        )
 
-    markers = ""
-    for ts in st.session_state.timestamps:
-        left_px = (ts / duration_ms) * 576.0
-        markers += f'<div class="marker" style="left:{left_px:.2f}px;" title="{format_timestamp(ts)}"></div>'
+    markers = render_timeline_markers(tuple(st.session_state.timestamps), duration_ms)
 
     debug_ts = 3850
     debug_left_pct = min((debug_ts / duration_ms) * 100.0, 100)
@@ -681,89 +1014,26 @@ if (
 
     with col1:
         st.markdown("#### 🎬 Video Timeline")
+        # Streamlit serves the file from its media endpoint (with range requests)
+        # instead of shipping a base64 copy of the whole video over the websocket
+        st.video(st.session_state.file_path)
         st.markdown(
-            f"""
-            <div style="position:relative; width:640px; margin-bottom:8px;">
-                <video id="videoPlayer" width="640" height="360" controls>
-                    <source src="data:video/mp4;base64,{st.session_state.file_base64}" type="video/mp4">
-                    Your browser does not support the video tag.
-                </video>
-                <div class="timeline-overlay">
-                    <div class="timeline-inner">
-                        {markers}{debug_marker}
-                    </div>
-                </div>
-            </div>
-
-            <style>
-            .timeline-overlay {{
-                position: absolute;
-                bottom: 42px;
-                width: 640px;
-                height: 0;
-                display: flex;
-                justify-content: center;
-                pointer-events: none;
-            }}
-            .timeline-inner {{
-                width: 576px;
-                height: 12px;
-                position: relative;
-            }}
-            .marker {{
-                position: absolute;
-                width: 4px;
-                height: 6px;
-                background-color: yellow;
-                box-shadow: 0 0 4px rgba(255, 255, 0, 0.9);
-            }}
-            .marker:hover::after {{
-                content: attr(title);
-                position: absolute;
-                top: -28px;
-                left: -10px;
-                background: black;
-                color: white;
-                padding: 2px 5px;
-                font-size: 10px;
-                border-radius: 4px;
-                white-space: nowrap;
-            }}
-            .debug-line {{
-                position: absolute;
-                width: 1px;
-                height: 12px;
-                background-color: red;
-                opacity: 0.9;
-            }}
-            </style>
-            """,
+            f'<div class="timeline-strip">{markers}{debug_marker}</div>\n{TIMELINE_STYLE}',
             unsafe_allow_html=True
         )
 
     with col2:
         if st.session_state.timestamps:
             st.markdown("#### ⏱️ Timestamp Viewer")
-            formatted_map = {format_timestamp(ts): ts for ts in st.session_state.timestamps}
-            formatted_list = list(formatted_map.keys())
-
-            selected_display = st.selectbox("Select timestamp", formatted_list)
-
-            if st.button("🔍 Show Frame at Timestamp"):
-                timestamp_ms = formatted_map[selected_display]
-                frame = extract_frame_at_timestamp(st.session_state.file_path, timestamp_ms)
-                if frame is not None:
-                    st.image(frame, caption=f"🖼 Frame at {selected_display}", width=320)
-                else:
-                    st.warning(f"❌ No frame available at {selected_display}")
+            timestamp_viewer(st.session_state.file_path, st.session_state.timestamps)
 
 # === Clear Session ===
 if st.session_state.file_path:
     if st.button("🧹 Clear Session & Delete File"):
-        try:
-            os.remove(st.session_state.file_path)
-            st.success(f"🗑 File deleted: {st.session_state.file_path}")
-        except Exception as e:
-            st.warning(f"Could not delete file: {e}")
-        for key in ["file_path", "file_type", "timestamps", "summary", "file_base64"]:
-            st.session_state[key] = None if key in ["file_path", "file_type"] else ""
+        if st.session_state.file_type == "video":
+            release_video_container(st.session_state.file_path)
+        # Deleting runs in the background so a slow disk never holds up the rerun
+        io_pool().submit(delete_upload, st.session_state.file_path)
+        st.success(f"🗑 File deleted: {st.session_state.file_path}")
+        st.session_state.update(SESSION_DEFAULTS)
+        cached_frame_jpeg.clear()
@@ -3,13 +3,10 @@
 Test HTML rendering in Streamlit with logging
 """
 import streamlit as st
-import sys
-import os
 
-# Add the app directory to the Python path
-sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
+from tools_lazy import lazy
 
-from tools.ui_components import ProductCard, PlatformBadge
+ui_components = lazy('tools.ui_components')
 
 def main():
     st.title("🧪 HTML Rendering Test")
@@ -32,7 +29,7 @@ def main():
     st.subheader("Test 1: Direct HTML Rendering")
     
     # Generate the card HTML
-    card_html = ProductCard.create_card(sample_product, 1)
+    card_html = ui_components.ProductCard.create_card(sample_product, 1)
     
     # Log details
     st.write(f"**Generated HTML Length:** {len(card_html)}")
@@ -77,7 +74,7 @@ def main():
     # Test 4: Platform badge test
     st.subheader("Test 4: Platform Badge Test")
     
-    badge_html = PlatformBadge.generate_badge('amazon')
+    badge_html = ui_components.PlatformBadge.generate_badge('amazon')
     st.write("Platform badge:")
     st.markdown(badge_html, unsafe_allow_html=True)
     
@@ -3,18 +3,39 @@
 Test script for new features: Google Vision, Direct Links, Price Filtering
 """
 
+import io
+import re
 import sys
-import os
-sys.path.append('./app')
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from tools_lazy import lazy
+
+# All four price-range phrasings in one pattern; the named group that matched says which
+_PRICE_RE = re.compile(
+    r'(?P<between>between\s+₹?(?P<b1>\d+)\s+and\s+₹?(?P<b2>\d+))'
+    r'|(?P<range>₹?(?P<r1>\d+)\s*[-to]\s*₹?(?P<r2>\d+))'
+    r'|(?P<under>under\s+₹?(?P<u>\d+))'
+    r'|(?P<above>above\s+₹?(?P<a>\d+))',
+    re.IGNORECASE
+)
+
+# (min, max) bounds for each alternative, keyed by the outer group name (match.lastgroup)
+_PRICE_BOUNDS = {
+    'between': lambda m: (float(m['b1']), float(m['b2'])),
+    'range': lambda m: (float(m['r1']), float(m['r2'])),
+    'under': lambda m: (None, float(m['u'])),
+    'above': lambda m: (float(m['a']), None),
+}
 
 def test_direct_retailer_extractor():
     """Test direct retailer URL extraction"""
     print("🔗 Testing Direct Retailer Extractor...")
     
     try:
-        from tools.direct_retailer_extractor import DirectRetailerExtractor
+        direct_retailer_extractor = lazy('tools.direct_retailer_extractor')
         
-        extractor = DirectRetailerExtractor()
+        extractor = direct_retailer_extractor.DirectRetailerExtractor()
         
         # Test sample URLs
         test_urls = [
@@ -42,7 +63,7 @@ def test_enhanced_price_scraper():
     print("💰 Testing Enhanced Price Scraper with Price Filtering...")
     
     try:
-        from tools.enhanced_price_scraper import enhanced_product_search
+        enhanced_product_search = lazy('tools.enhanced_price_scraper').enhanced_product_search
         
         # Test basic search
         results = enhanced_product_search('Tide detergent', quantity='500ml', limit=3)
@@ -74,9 +95,9 @@ def test_google_vision():
     print("👁️ Testing Google Vision Integration...")
     
     try:
-        from tools.google_vision import GoogleVisionProductDetector
+        google_vision = lazy('tools.google_vision')
         
-        detector = GoogleVisionProductDetector()
+        detector = google_vision.GoogleVisionProductDetector()
         
         # Test with placeholder (will use fallback)
         print("   Testing fallback product detection...")
@@ -96,7 +117,8 @@ def test_ui_components():
     print("🎨 Testing Enhanced UI Components...")
     
     try:
-        from tools.ui_components import PlatformBadge, ProductCard
+        ui_components = lazy('tools.ui_components')
+        PlatformBadge, ProductCard = ui_components.PlatformBadge, ui_components.ProductCard
         
         # Test platform detection
         test_platforms = ['amazon', 'flipkart', 'bigbasket', 'nykaa', 'zepto']
@@ -135,34 +157,11 @@ def test_price_extraction():
     
     try:
         # Simulate the extraction function
-        import re
-        
         def extract_price_range(query):
-            range_patterns = [
-                r'₹?(\d+)\s*[-to]\s*₹?(\d+)',
-                r'between\s+₹?(\d+)\s+and\s+₹?(\d+)',
-                r'under\s+₹?(\d+)',
-                r'above\s+₹?(\d+)'
-            ]
-            
-            query_lower = query.lower()
-            
-            for pattern in range_patterns[:2]:  # Range patterns
-                match = re.search(pattern, query_lower)
-                if match:
-                    return float(match.group(1)), float(match.group(2))
-            
-            for pattern in range_patterns[2:3]:  # Under patterns
-                match = re.search(pattern, query_lower)
-                if match:
-                    return None, float(match.group(1))
-            
-            for pattern in range_patterns[3:]:  # Above patterns
-                match = re.search(pattern, query_lower)
-                if match:
-                    return float(match.group(1)), None
-            
-            return None, None
+            match = _PRICE_RE.search(query)
+            if not match:
+                return None, None
+            return _PRICE_BOUNDS[match.lastgroup](match)
         
         test_queries = [
             "Find Tide detergent between ₹100 and ₹500",
@@ -184,6 +183,32 @@ def test_price_extraction():
         print(f"   ❌ Error: {str(e)}")
         return False
 
+class _ThreadLocalStdout:
+    """stdout proxy that sends each worker thread's prints to its own buffer"""
+    
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+    
+    def write(self, text):
+        return getattr(self._local, 'buffer', self._stream).write(text)
+    
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+    
+    def run(self, test_func):
+        """Run test_func, returning (success, everything it printed)"""
+        self._local.buffer = io.StringIO()
+        try:
+            success = test_func()
+        except Exception as e:
+            print(f"   ❌ Test failed: {str(e)}")
+            success = False
+        finally:
+            output = self._local.buffer.getvalue()
+            del self._local.buffer
+        return success, output
+
 def main():
     """Run all tests"""
     print("🧪 TESTING NEW FEATURES")
@@ -197,16 +222,22 @@ def main():
         ("Price Range Extraction", test_price_extraction)
     ]
     
+    # The tests are independent and mostly network-bound, so run them side by side;
+    # each one's output is buffered and replayed in the original order
+    stdout = _ThreadLocalStdout(sys.stdout)
+    sys.stdout = stdout
+    try:
+        with ThreadPoolExecutor(max_workers=len(tests)) as executor:
+            outcomes = list(executor.map(stdout.run, [test_func for _, test_func in tests]))
+    finally:
+        sys.stdout = stdout._stream
+    
     results = []
     
-    for test_name, test_func in tests:
+    for (test_name, _), (success, output) in zip(tests, outcomes):
         print(f"\n{test_name}:")
-        try:
-            success = test_func()
-            results.append((test_name, success))
-        except Exception as e:
-            print(f"   ❌ Test failed: {str(e)}")
-            results.append((test_name, False))
+        print(output, end='')
+        results.append((test_name, success))
     
     print("\n" + "=" * 50)
     print("📊 TEST RESULTS:")
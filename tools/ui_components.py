@@ -4,6 +4,7 @@ Provides clean, modern UI elements similar to Amazon/Flipkart
 """
 
 import streamlit as st
+from html import escape
 from typing import Dict, List, Optional
 
 class PlatformBadge:
@@ -104,6 +105,8 @@ class ProductCard:
         """
         # Extract data with defaults
         title = product_data.get('title', 'Product Title')[:60] + "..." if len(product_data.get('title', '')) > 60 else product_data.get('title', 'Product Title')
+        # Escaped only after truncation, so the cut can't split an entity
+        title = escape(title)
         price = product_data.get('price', '₹N/A')
         rating = product_data.get('rating', '4.0')
         review_count = product_data.get('review_count', '0')
@@ -137,6 +140,21 @@ class ProductCard:
         
         return card_html
 
+    @staticmethod
+    def create_cards_bulk(products: List[Dict], card_wrapper: str = '{}') -> str:
+        """
+        Render every product card into a single HTML string, ranked from 1
+
+        Args:
+            products: Product information dictionaries, in display order
+            card_wrapper: Format string each card is placed into (e.g. a grid cell div)
+        """
+        create_card = ProductCard.create_card
+        return ''.join(
+            card_wrapper.format(create_card(product_data, rank))
+            for rank, product_data in enumerate(products, 1)
+        )
+
 class ComparisonTable:
     """Professional comparison table component"""
     
@@ -167,6 +185,7 @@ class ComparisonTable:
     def create_best_deal_banner(product_data: Dict) -> str:
         """Create best deal banner"""
         title = product_data.get('title', 'Product')[:40] + "..." if len(product_data.get('title', '')) > 40 else product_data.get('title', 'Product')
+        title = escape(title)
         price = product_data.get('price', '₹N/A')
         platform = product_data.get('platform', 'default')
         platform_name = PlatformBadge.PLATFORM_COLORS.get(platform, PlatformBadge.PLATFORM_COLORS['default'])['name']
@@ -0,0 +1,37 @@
+"""
+Lazy module imports for the test scripts
+Puts app/ on the import path once and defers executing heavy tool modules
+(scrapers pulling in requests/bs4, UI components pulling in streamlit)
+until one of their attributes is actually used
+"""
+
+import importlib.util
+import os
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app')
+if APP_DIR not in sys.path:
+    sys.path.append(APP_DIR)
+
+
+def lazy(name: str):
+    """
+    Return module `name` without executing it yet
+
+    The module body runs on first attribute access, so a missing dependency
+    surfaces there (as ImportError) rather than at the lazy() call.
+    Raises ImportError right away only if the module itself cannot be found.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named '{name}'", name=name)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -2,8 +2,18 @@
 """
 Comprehensive verification test after fixing AttributeError
 """
-import sys
-sys.path.append('./app')
+import re
+
+from tools_lazy import lazy
+
+# Anything that breaks st.markdown's raw-HTML rendering: newlines, tabs or HTML comments
+_BAD_RE = re.compile(r'[\n\t]|<!--')
+
+# Grid cell used to check that create_cards_bulk places each card inside its wrapper
+_CELL_WRAPPER = '<section class="cell">{}</section>'
+_CELL_RE = re.compile(r'<section class="cell">(.*?)</section>')
+# The rank badge is the first bold div of a card
+_RANK_RE = re.compile(r'font-weight: bold;">(\d+)</div>')
 
 def test_complete_workflow():
     """Test the complete application workflow"""
@@ -11,16 +21,15 @@ def test_complete_workflow():
     print("="*50)
     
     try:
-        # Import all necessary modules
-        from tools.enhanced_price_scraper import enhanced_product_search
-        from tools.ui_components import ProductCard, ComparisonTable
-        from tools.quantity_matcher import QuantityMatcher
+        # Locate all necessary modules; each one loads on first use
+        enhanced_price_scraper = lazy('tools.enhanced_price_scraper')
+        ui_components = lazy('tools.ui_components')
         
-        print("\n✅ All modules imported successfully")
+        print("\n✅ All modules found")
         
         # Test 1: Enhanced Product Search
         print("\n1️⃣ Testing Enhanced Product Search...")
-        products = enhanced_product_search('Dettol handwash', quantity='250ml', limit=3)
+        products = enhanced_price_scraper.enhanced_product_search('Dettol handwash', quantity='250ml', limit=3)
         
         print(f"   Return Type: {type(products)}")
         print(f"   Number of Products: {len(products)}")
@@ -57,10 +66,10 @@ def test_complete_workflow():
         # Test 3: HTML Generation
         print("\n3️⃣ Testing HTML Generation...")
         for i, product in enumerate(products[:2]):
-            card_html = ProductCard.create_card(product, i+1)
+            card_html = ui_components.ProductCard.create_card(product, i+1)
             
             # Check HTML quality
-            is_clean = not (chr(10) in card_html or chr(9) in card_html or '<!--' in card_html)
+            is_clean = not _BAD_RE.search(card_html)
             has_image = '<img' in card_html
             has_buy_button = 'Buy Now' in card_html
             has_price = product['price'] in card_html
@@ -105,26 +114,38 @@ def test_complete_workflow():
         print("\n5️⃣ Testing End-to-End HTML Rendering...")
         
         # Generate comparison header
-        header_html = ComparisonTable.create_comparison_header(
+        header_html = ui_components.ComparisonTable.create_comparison_header(
             "Dettol Handwash", "250ml", len(product_cards)
         )
         
-        # Generate all product cards
-        all_cards_html = []
-        for i, product_data in enumerate(product_cards):
-            card_html = ProductCard.create_card(product_data, i + 1)
-            all_cards_html.append(card_html)
+        # Generate all product cards - the app renders them in one pass with create_cards_bulk
+        all_cards_html = [
+            ui_components.ProductCard.create_card(product_data, i + 1)
+            for i, product_data in enumerate(product_cards)
+        ]
+        bulk_html = ui_components.ProductCard.create_cards_bulk(product_cards, card_wrapper=_CELL_WRAPPER)
         
-        total_html_size = len(header_html) + sum(len(card) for card in all_cards_html)
+        # Every card must sit in its own wrapper, with nothing between the cells
+        cells = _CELL_RE.findall(bulk_html)
+        if len(cells) != len(product_cards) or ''.join(map(_CELL_WRAPPER.format, cells)) != bulk_html:
+            print(f"   ❌ ERROR: Expected {len(product_cards)} wrapped cards, found {len(cells)}")
+            return False
+        
+        # Ranks are numbered from 1 in display order
+        ranks = [int(m.group(1)) if m else None for m in map(_RANK_RE.search, cells)]
+        expected_ranks = list(range(1, len(product_cards) + 1))
+        print(f"   Card ranks: {ranks}")
+        if ranks != expected_ranks:
+            print(f"   ❌ ERROR: Card ranks {ranks}, expected {expected_ranks}")
+            return False
+        
+        total_html_size = len(header_html) + sum(map(len, all_cards_html))
         print(f"   Header HTML: {len(header_html)} chars")
         print(f"   Product Cards: {len(all_cards_html)} cards")
         print(f"   Total HTML Size: {total_html_size} chars")
         
-        # Check if all HTML is clean
-        all_html_clean = all(
-            not (chr(10) in card or chr(9) in card or '<!--' in card)
-            for card in all_cards_html
-        )
+        # Check if all HTML is clean - one scan over the grid the app actually sends
+        all_html_clean = not _BAD_RE.search(bulk_html)
         
         print(f"   All HTML Clean: {all_html_clean}")
         